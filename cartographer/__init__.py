@@ -4,8 +4,52 @@ Cartographer - Grafo de Conocimiento
 Sistema de conexión semántica entre videos estilo Obsidian.
 """
 
+import threading
+from typing import Optional
+
 from cartographer.extractor import extract_from_nugget, extract_all
-from cartographer.graph import KnowledgeGraph, rebuild_graph, DATA_DIR
+from cartographer.graph import KnowledgeGraph, rebuild_graph, journal_path, DATA_DIR
+
+GRAPH_FILE = DATA_DIR / "graph.json"
+GRAPH_JOURNAL = journal_path(GRAPH_FILE)
+
+# Grafo cargado, reutilizado mientras graph.json y su journal no cambien:
+# {(ruta, mtime_ns, journal_mtime_ns): KnowledgeGraph}
+_graph_cache: dict = {}
+_graph_lock = threading.Lock()
+
+
+def _graph() -> KnowledgeGraph:
+    """
+    Devuelve el grafo de disco, parseando graph.json solo si ha cambiado.
+
+    El objeto es compartido: las consultas no deben modificarlo.
+    """
+    key = (str(GRAPH_FILE), _mtime_ns(GRAPH_FILE), _mtime_ns(GRAPH_JOURNAL))
+    if key[1:] == (None, None):
+        return KnowledgeGraph()
+
+    with _graph_lock:
+        graph = _graph_cache.get(key)
+        if graph is None:
+            graph = KnowledgeGraph.load(GRAPH_FILE)
+            _graph_cache.clear()
+            _graph_cache[key] = graph
+        return graph
+
+
+def _mtime_ns(path) -> Optional[int]:
+    """mtime del archivo, o None si no existe."""
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _invalidate_graph():
+    """Descarta el grafo cacheado tras escribir graph.json o el journal."""
+    with _graph_lock:
+        _graph_cache.clear()
 
 
 def map_video(video_id: str, vault_path: str = "vault") -> dict:
@@ -24,10 +68,11 @@ def map_video(video_id: str, vault_path: str = "vault") -> dict:
     # Extraer conceptos
     extraction = extract_from_nugget(video_id, vault_path)
 
-    # Cargar grafo existente y agregar
-    graph = KnowledgeGraph.load()
-    graph.add_concepts_from_video(video_id, extraction)
-    graph.save()
+    # Cargar grafo existente (copia propia, no la cacheada) y agregar;
+    # solo se escribe una línea en el journal, no graph.json entero
+    graph = KnowledgeGraph.load(GRAPH_FILE)
+    graph.append_video(video_id, extraction, GRAPH_FILE)
+    _invalidate_graph()
 
     return extraction
 
@@ -42,7 +87,7 @@ def get_related(video_id: str) -> list:
     Returns:
         Lista de videos relacionados
     """
-    graph = KnowledgeGraph.load()
+    graph = _graph()
     return graph.get_related_videos(video_id)
 
 
@@ -56,7 +101,7 @@ def get_concept(name: str) -> dict:
     Returns:
         dict con info del concepto
     """
-    graph = KnowledgeGraph.load()
+    graph = _graph()
     return graph.get_concept_info(name)
 
 
@@ -67,25 +112,39 @@ def get_graph_data() -> dict:
     Returns:
         dict con nodes y links
     """
-    graph = KnowledgeGraph.load()
+    graph = _graph()
     return graph.to_d3_format()
 
 
-def rebuild(vault_path: str = "vault") -> dict:
+def iter_graph_data():
+    """
+    Obtiene el grafo en formato D3.js como JSON en trozos de bytes.
+
+    El grafo se carga antes de devolver el iterador, así que los errores
+    de lectura se lanzan aquí y no a mitad de la respuesta.
+
+    Returns:
+        Iterador de bytes (ver KnowledgeGraph.iter_d3_json)
+    """
+    return _graph().iter_d3_json()
+
+
+def rebuild(vault_path: str = "vault", max_workers: Optional[int] = None) -> dict:
     """
     Reconstruye el grafo completo desde cero.
 
     Args:
         vault_path: Ruta al vault
+        max_workers: Extracciones de conceptos simultáneas (None: las de extract_all)
 
     Returns:
         Estadísticas del grafo
     """
-    graph = rebuild_graph(vault_path)
-    data = graph.to_d3_format()
+    graph = rebuild_graph(vault_path, max_workers)
+    _invalidate_graph()
 
     return {
-        'concepts': len(data['nodes']),
-        'relations': len(data['links']),
+        'concepts': len(graph.concepts),
+        'relations': len(graph.relations),
         'videos': len(graph.sources)
     }
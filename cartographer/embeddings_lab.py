@@ -5,25 +5,74 @@ Experimenta con embeddings semánticos usando nomic-embed-text.
 Funciones para búsqueda, similitud, clustering y visualización.
 """
 
+import atexit
+import http.client
 import json
+import os
 import subprocess
-import random
-import urllib.request
+import threading
+import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
+
+from cartographer import _graph
+from gemcutter import ollama_pool
+
+# orjson (C) parsea los 768 floats de cada respuesta mucho más rápido
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# numba (opcional) compila el producto escalar de un par de vectores, donde
+# la sobrecarga por llamada de NumPy pesa más que el cálculo
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 # Rutas
 CARTOGRAPHER_DIR = Path(__file__).parent
 DATA_DIR = CARTOGRAPHER_DIR / "data"
-GRAPH_FILE = DATA_DIR / "graph.json"
+CACHE_FILE = DATA_DIR / "emb_cache.npz"
 
 # Configuración
 EMBEDDING_MODEL = "nomic-embed-text"
 EMBEDDING_DIMS = 768
 OLLAMA_API = "http://localhost:11434/api/embeddings"
+OLLAMA_BATCH_API = "http://localhost:11434/api/embed"  # Ollama >= 0.2: varios textos por petición
+MAX_WORKERS = 8  # Peticiones simultáneas a Ollama (si no hay API por lotes)
+QUANT_THRESHOLD = 1024  # A partir de estos conceptos se busca primero en int8
+RERANK_FACTOR = 4  # Candidatos int8 por resultado que se reordenan en float32
 
 # Cache de embeddings para evitar llamadas repetidas
+# (_norm_key(texto) -> np.ndarray float32)
 _embeddings_cache: dict = {}
+_cache_dirty = False
+_cache_lock = threading.Lock()
+
+# Se desactiva si el servidor de Ollama no tiene /api/embed (HTTP 404)
+_batch_supported = True
+
+# Matriz (N, EMBEDDING_DIMS) con los embeddings de los conceptos, apilada una
+# sola vez y reconstruida cuando cambia la lista de conceptos
+_concept_names: list = []
+_concept_matrix: Optional[np.ndarray] = None
+_concept_key: Optional[tuple] = None
+
+# Copia int8 de _concept_matrix (q = round(v / scale)) para colecciones grandes
+_concept_matrix_i8: Optional[np.ndarray] = None
+
+# Matriz de similitudes (N, N) entre conceptos; se invalida con _concept_matrix
+_sim_matrix_cache: Optional[np.ndarray] = None
+
+# Generador propio para el quiz: no toca el estado global de `random`
+_rng = np.random.default_rng()
 
 
 def verify_model() -> dict:
@@ -38,7 +87,7 @@ def verify_model() -> dict:
         if installed:
             # Verificar que funciona
             test = get_embedding("test")
-            if test:
+            if test is not None:
                 return {
                     "status": "ok",
                     "model": EMBEDDING_MODEL,
@@ -57,54 +106,140 @@ def verify_model() -> dict:
         }
 
 
-def get_embedding(text: str) -> Optional[list]:
-    """Genera embedding para un texto usando Ollama API HTTP."""
+def get_embedding(text: str) -> Optional[np.ndarray]:
+    """
+    Genera embedding para un texto usando Ollama API HTTP.
+
+    El vector se devuelve en float32 y normalizado (norma L2 = 1), de modo
+    que la similitud coseno entre dos embeddings es su producto escalar.
+    """
     # Check cache
-    if text in _embeddings_cache:
-        return _embeddings_cache[text]
+    key = _norm_key(text)
+    if key in _embeddings_cache:
+        return _embeddings_cache[key]
 
     try:
         # Usar API HTTP de Ollama (no hay comando CLI para embeddings)
-        data = json.dumps({
+        result = _post_json(OLLAMA_API, {
             "model": EMBEDDING_MODEL,
             "prompt": text
-        }).encode('utf-8')
+        }, timeout=30)
+        embedding = result.get("embedding", [])
+
+        if embedding:
+            # Normalizar una sola vez antes de cachear
+            vector = _normalize(embedding)
+            _cache_embedding(text, vector)
+            return vector
+    except Exception as e:
+        print(f"Error generating embedding: {e}")
 
-        req = urllib.request.Request(
-            OLLAMA_API,
-            data=data,
-            headers={'Content-Type': 'application/json'}
-        )
+    return None
+
+
+def _post_json(url: str, payload: dict, timeout: float) -> dict:
+    """
+    POST JSON a Ollama con una conexión keep-alive del pool compartido.
+
+    Raises:
+        urllib.error.HTTPError: si Ollama responde con un estado distinto de 200
+    """
+    parts = urllib.parse.urlsplit(url)
+    body = json.dumps(payload).encode('utf-8')
+
+    # Un reintento si el servidor cerró la conexión reutilizada
+    for attempt in range(2):
+        try:
+            with ollama_pool.connection(timeout) as conn:
+                conn.request("POST", parts.path, body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                data = response.read()
+            break
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if attempt:
+                raise
+
+    if response.status != 200:
+        raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+    return _loads(data)
 
-        with urllib.request.urlopen(req, timeout=30) as response:
-            result = json.loads(response.read().decode('utf-8'))
-            embedding = result.get("embedding", [])
 
-            if embedding:
-                # Cache it
-                _embeddings_cache[text] = embedding
-                return embedding
+def _normalize(embedding) -> np.ndarray:
+    """Convierte a float32 y normaliza a norma L2 unitaria."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _norm_key(text: str) -> str:
+    """Clave de cache: minúsculas y espacios colapsados ("Python " == "python")."""
+    return " ".join(text.lower().split())
+
+
+def _cache_embedding(text: str, vector: np.ndarray):
+    """Guarda un embedding en el cache en memoria y lo marca para persistir."""
+    global _cache_dirty
+    with _cache_lock:
+        _embeddings_cache[_norm_key(text)] = vector
+        _cache_dirty = True
+
+
+def _load_cache():
+    """Precarga el cache de embeddings persistido en disco (si existe)."""
+    if not CACHE_FILE.exists():
+        return
+
+    try:
+        with np.load(CACHE_FILE) as data:
+            # Embeddings de otro modelo no son comparables
+            if str(data["model"]) != EMBEDDING_MODEL:
+                return
+            for text, vector in zip(data["keys"].tolist(), data["vecs"]):
+                _embeddings_cache.setdefault(_norm_key(text), vector)
     except Exception as e:
-        print(f"Error generating embedding: {e}")
+        print(f"Error loading embeddings cache: {e}")
 
-    return None
 
+def flush_cache():
+    """Escribe el cache de embeddings a disco si hubo cambios."""
+    global _cache_dirty
+    with _cache_lock:
+        if not _cache_dirty or not _embeddings_cache:
+            return
+        keys = list(_embeddings_cache.keys())
+        vecs = list(_embeddings_cache.values())
+        _cache_dirty = False
 
-def load_concepts() -> list:
-    """Carga conceptos del grafo existente o usa ejemplos."""
-    if GRAPH_FILE.exists():
-        with open(GRAPH_FILE, 'r', encoding='utf-8') as f:
-            graph = json.load(f)
+    try:
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_file = CACHE_FILE.with_suffix(".tmp")
+        with open(tmp_file, "wb") as f:
+            np.savez(
+                f,
+                model=np.array(EMBEDDING_MODEL),
+                keys=np.array(keys),
+                vecs=np.stack(vecs)
+            )
+        os.replace(tmp_file, CACHE_FILE)
+    except Exception as e:
+        print(f"Error saving embeddings cache: {e}")
+
+
+_load_cache()
+atexit.register(flush_cache)
 
-            # El grafo usa "concepts" (diccionario) no "nodes" (array)
-            concepts_dict = graph.get("concepts", {})
-            if concepts_dict:
-                return list(concepts_dict.keys())
 
-            # Fallback a formato nodes (por si acaso)
-            nodes = graph.get("nodes", [])
-            if nodes:
-                return [node.get("id", node.get("name", "")) for node in nodes]
+def load_concepts() -> list:
+    """
+    Carga conceptos del grafo existente o usa ejemplos.
+
+    El grafo se lee con su journal (los videos mapeados después del último
+    snapshot), el mismo que usan las consultas del servidor.
+    """
+    concepts = list(_graph().concepts)
+    if concepts:
+        return concepts
 
     # Conceptos de ejemplo si no hay grafo
     return [
@@ -115,19 +250,31 @@ def load_concepts() -> list:
     ]
 
 
-def cosine_similarity(vec1: list, vec2: list) -> float:
-    """Calcula similitud coseno entre dos vectores."""
-    if not vec1 or not vec2 or len(vec1) != len(vec2):
-        return 0.0
-
-    dot_product = sum(a * b for a, b in zip(vec1, vec2))
-    norm1 = sum(a * a for a in vec1) ** 0.5
-    norm2 = sum(b * b for b in vec2) ** 0.5
-
-    if norm1 == 0 or norm2 == 0:
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _cos_unit(a, b):
+        """Producto escalar de dos vectores unitarios (= similitud coseno)."""
+        s = 0.0
+        for i in range(a.shape[0]):
+            s += a[i] * b[i]
+        return s
+else:
+    def _cos_unit(a, b):
+        """Producto escalar de dos vectores unitarios (= similitud coseno)."""
+        return np.dot(a, b)
+
+
+def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
+    """
+    Calcula similitud coseno entre dos embeddings.
+
+    Los embeddings de get_embedding() ya están normalizados, así que basta
+    con el producto escalar.
+    """
+    if vec1 is None or vec2 is None or vec1.shape != vec2.shape:
         return 0.0
 
-    return dot_product / (norm1 * norm2)
+    return float(_cos_unit(vec1, vec2))
 
 
 def compute_similarity(concept_a: str, concept_b: str) -> dict:
@@ -135,7 +282,7 @@ def compute_similarity(concept_a: str, concept_b: str) -> dict:
     emb_a = get_embedding(concept_a)
     emb_b = get_embedding(concept_b)
 
-    if not emb_a or not emb_b:
+    if emb_a is None or emb_b is None:
         return {"error": "No se pudo generar embedding"}
 
     similarity = cosine_similarity(emb_a, emb_b)
@@ -169,33 +316,117 @@ def semantic_search(query: str, concepts: list = None, top_k: int = 5) -> list:
         concepts = load_concepts()
 
     query_emb = get_embedding(query)
-    if not query_emb:
+    if query_emb is None:
         return []
 
-    results = []
-    for concept in concepts:
-        concept_emb = get_embedding(concept)
-        if concept_emb:
-            sim = cosine_similarity(query_emb, concept_emb)
-            results.append({
-                "concept": concept,
-                "similarity": round(sim, 3),
-                "bar_width": int(sim * 100)
-            })
+    names, matrix = _get_concept_matrix(concepts)
+    if not names:
+        return []
 
-    # Ordenar por similitud descendente
-    results.sort(key=lambda x: x["similarity"], reverse=True)
+    if _concept_matrix_i8 is not None and matrix is _concept_matrix:
+        # Colección grande: preselección aproximada en int8, reordenada en float32
+        candidates = _quantized_candidates(query_emb, top_k * RERANK_FACTOR)
+        sims = np.full(len(names), -np.inf, dtype=np.float32)
+        sims[candidates] = matrix[candidates] @ query_emb
+        order = candidates[np.argsort(-sims[candidates])][:top_k]
+    else:
+        # Todas las similitudes en una sola multiplicación matriz-vector
+        sims = matrix @ query_emb
 
-    # Añadir emojis según posición
-    for i, r in enumerate(results[:top_k]):
-        if i == 0:
-            r["emoji"] = "🎯"
-        elif r["similarity"] >= 0.6:
-            r["emoji"] = "🎯"
+        # Seleccionar los top_k en O(N) y ordenar solo esos
+        if top_k < len(sims):
+            order = np.argpartition(-sims, top_k)[:top_k]
+            order = order[np.argsort(-sims[order])]
         else:
-            r["emoji"] = "✅"
+            order = np.argsort(-sims)
+
+    results = []
+    for i, idx in enumerate(order):
+        sim = float(sims[idx])
+        results.append({
+            "concept": names[idx],
+            "similarity": round(sim, 3),
+            "bar_width": int(sim * 100),
+            # Añadir emojis según posición
+            "emoji": "🎯" if i == 0 or sim >= 0.6 else "✅"
+        })
 
-    return results[:top_k]
+    return results
+
+
+def _quantize(matrix: np.ndarray) -> tuple:
+    """Cuantiza a int8 con una escala por matriz. Devuelve (q, scale)."""
+    scale = float(np.abs(matrix).max()) / 127 if matrix.size else 0.0
+    if scale == 0.0:
+        return np.zeros(matrix.shape, dtype=np.int8), 1.0
+    return np.round(matrix / scale).astype(np.int8), scale
+
+
+def _quantized_candidates(query_emb: np.ndarray, n: int) -> np.ndarray:
+    """Índices de los n conceptos más similares según la matriz int8."""
+    q_query, _ = _quantize(query_emb)
+    # Acumular en int32: el producto de int8 desbordaría. La escala es
+    # positiva y común a todas las filas, así que no altera el orden
+    approx = _concept_matrix_i8.astype(np.int32) @ q_query.astype(np.int32)
+    if n >= len(approx):
+        return np.arange(len(approx))
+    return np.argpartition(-approx, n)[:n]
+
+
+def get_embeddings_batch(texts: list) -> dict:
+    """
+    Genera embeddings para varios textos con una sola petición a Ollama.
+
+    Solo se piden los textos que no están en cache. Si Ollama no soporta
+    /api/embed se recurre a una petición por texto, en paralelo.
+
+    Returns:
+        dict {texto: embedding} con los textos que tienen embedding
+    """
+    global _batch_supported
+
+    # Un texto por clave normalizada; se envía la primera variante vista
+    pending = {}
+    for text in texts:
+        key = _norm_key(text)
+        if key not in _embeddings_cache:
+            pending.setdefault(key, text)
+    missing = list(pending.values())
+
+    if missing and _batch_supported:
+        try:
+            result = _post_json(OLLAMA_BATCH_API, {
+                "model": EMBEDDING_MODEL,
+                "input": missing
+            }, timeout=120)
+
+            for text, embedding in zip(missing, result.get("embeddings", [])):
+                if embedding:
+                    _cache_embedding(text, _normalize(embedding))
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                # Versión antigua de Ollama: usar /api/embeddings
+                _batch_supported = False
+            else:
+                print(f"Error generating embeddings: {e}")
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+
+    if not _batch_supported:
+        # Las peticiones HTTP liberan el GIL, así que basta con hilos
+        missing = [t for t in missing if _norm_key(t) not in _embeddings_cache]
+        if len(missing) > 1:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                list(executor.map(get_embedding, missing))
+        elif missing:
+            get_embedding(missing[0])
+
+    embeddings = {}
+    for text in texts:
+        vector = _embeddings_cache.get(_norm_key(text))
+        if vector is not None:
+            embeddings[text] = vector
+    return embeddings
 
 
 def get_all_embeddings(concepts: list = None) -> dict:
@@ -203,17 +434,57 @@ def get_all_embeddings(concepts: list = None) -> dict:
     if concepts is None:
         concepts = load_concepts()
 
-    embeddings = {}
-    for concept in concepts:
-        emb = get_embedding(concept)
-        if emb:
-            embeddings[concept] = emb
+    return get_embeddings_batch(concepts)
 
-    return embeddings
+
+def _get_concept_matrix(concepts: list) -> tuple:
+    """
+    Devuelve (nombres, matriz) con los embeddings de los conceptos apilados.
+
+    La matriz se reutiliza mientras la lista de conceptos no cambie. Si algún
+    embedding falla no se cachea, para reintentarlo en la próxima llamada.
+    """
+    global _concept_names, _concept_matrix, _concept_key, _sim_matrix_cache
+    global _concept_matrix_i8
+
+    key = tuple(concepts)
+    if _concept_matrix is not None and key == _concept_key:
+        return _concept_names, _concept_matrix
+
+    _sim_matrix_cache = None
+    embeddings = get_all_embeddings(concepts)
+    _concept_names = list(embeddings.keys())
+    if embeddings:
+        _concept_matrix = np.stack(list(embeddings.values()))
+    else:
+        _concept_matrix = np.empty((0, EMBEDDING_DIMS), dtype=np.float32)
+    _concept_key = key if len(embeddings) == len(set(concepts)) else None
+
+    if len(_concept_names) >= QUANT_THRESHOLD:
+        _concept_matrix_i8, _ = _quantize(_concept_matrix)
+    else:
+        _concept_matrix_i8 = None
+
+    return _concept_names, _concept_matrix
+
+
+def _get_similarity_matrix(concepts: list) -> tuple:
+    """
+    Devuelve (nombres, G) con G[i, j] = similitud entre conceptos i y j.
+
+    Con embeddings unitarios G = M @ M.T, calculada una sola vez.
+    """
+    global _sim_matrix_cache
+
+    names, matrix = _get_concept_matrix(concepts)
+    if _sim_matrix_cache is None:
+        _sim_matrix_cache = matrix @ matrix.T
+
+    return names, _sim_matrix_cache
 
 
 def compute_pca_2d(embeddings: dict) -> list:
-    """Reduce embeddings a 2D usando PCA simple."""
+    """Reduce embeddings a 2D con PCA (dos componentes principales via SVD)."""
     if not embeddings:
         return []
 
@@ -223,40 +494,21 @@ def compute_pca_2d(embeddings: dict) -> list:
     if len(vectors) < 2:
         return [{"concept": concepts[0], "x": 0, "y": 0}] if concepts else []
 
-    # PCA simplificado (sin sklearn para evitar dependencia)
-    # Centramos los datos
-    n = len(vectors)
-    dims = len(vectors[0])
-
-    # Media por dimensión
-    means = [sum(v[d] for v in vectors) / n for d in range(dims)]
-
-    # Centrar
-    centered = [[v[d] - means[d] for d in range(dims)] for v in vectors]
-
-    # Tomar las dos primeras componentes principales (simplificado)
-    # En realidad deberíamos calcular eigenvectors, pero para visualización
-    # basta con proyectar en dos dimensiones con varianza alta
+    # Centrar los datos
+    X = np.stack(vectors).astype(np.float32)
+    centered = X - X.mean(axis=0)
 
-    # Calcular varianza por dimensión
-    variances = []
-    for d in range(min(dims, 100)):  # Solo primeras 100 dims
-        var = sum(c[d] ** 2 for c in centered) / n
-        variances.append((d, var))
-
-    # Tomar las dos dimensiones con mayor varianza
-    variances.sort(key=lambda x: x[1], reverse=True)
-    dim1, dim2 = variances[0][0], variances[1][0]
+    # Las filas de Vt son las direcciones principales, ordenadas por varianza
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    coords = centered @ vt[:2].T
 
     # Proyectar
     points = []
     for i, concept in enumerate(concepts):
-        x = centered[i][dim1]
-        y = centered[i][dim2]
         points.append({
             "concept": concept,
-            "x": round(x * 100, 2),  # Escalar para visualización
-            "y": round(y * 100, 2)
+            "x": round(float(coords[i, 0]) * 100, 2),  # Escalar para visualización
+            "y": round(float(coords[i, 1]) * 100, 2)
         })
 
     return points
@@ -268,44 +520,29 @@ def detect_clusters(embeddings: dict, n_clusters: int = 3) -> list:
         return [{"cluster": 0, "concepts": list(embeddings.keys())}]
 
     concepts = list(embeddings.keys())
-    vectors = list(embeddings.values())
+    X = np.stack(list(embeddings.values())).astype(np.float32)
 
-    # K-means simplificado
-    # Inicializar centroides aleatorios
-    random.seed(42)  # Reproducibilidad
-    centroid_indices = random.sample(range(len(vectors)), n_clusters)
-    centroids = [vectors[i][:] for i in centroid_indices]
+    # K-means esférico: con vectores unitarios ||a - c||² = 2 - 2·(a·c),
+    # así que el centroide más cercano es el de mayor producto escalar
+    # Inicializar centroides aleatorios (semilla fija para reproducibilidad)
+    rng = np.random.default_rng(42)
+    centroids = X[rng.choice(len(X), n_clusters, replace=False)].copy()
 
     # Iterar
     for _ in range(10):  # Máximo 10 iteraciones
-        # Asignar puntos a clusters
-        assignments = []
-        for vec in vectors:
-            distances = [
-                sum((a - b) ** 2 for a, b in zip(vec, c))
-                for c in centroids
-            ]
-            assignments.append(distances.index(min(distances)))
-
-        # Actualizar centroides
-        new_centroids = []
+        # Asignar puntos a clusters: una sola multiplicación (N, k)
+        assignments = np.argmax(X @ centroids.T, axis=1)
+
+        # Actualizar centroides (renormalizados a la esfera unidad)
         for k in range(n_clusters):
-            cluster_vecs = [vectors[i] for i, a in enumerate(assignments) if a == k]
-            if cluster_vecs:
-                dims = len(cluster_vecs[0])
-                new_centroid = [
-                    sum(v[d] for v in cluster_vecs) / len(cluster_vecs)
-                    for d in range(dims)
-                ]
-                new_centroids.append(new_centroid)
-            else:
-                new_centroids.append(centroids[k])
-        centroids = new_centroids
+            members = assignments == k
+            if members.any():
+                centroids[k] = _normalize(X[members].mean(axis=0))
 
     # Formar clusters
     clusters = []
     for k in range(n_clusters):
-        cluster_concepts = [concepts[i] for i, a in enumerate(assignments) if a == k]
+        cluster_concepts = [concepts[i] for i in np.flatnonzero(assignments == k)]
         if cluster_concepts:
             clusters.append({
                 "cluster": k,
@@ -324,33 +561,28 @@ def generate_quiz_question(concepts: list = None) -> dict:
     if len(concepts) < 4:
         return {"error": "Necesitas al menos 4 conceptos"}
 
-    # Elegir concepto base
-    base = random.choice(concepts)
-
-    # Calcular similitudes con todos los demás
-    similarities = []
-    for c in concepts:
-        if c != base:
-            result = compute_similarity(base, c)
-            if "similarity" in result:
-                similarities.append((c, result["similarity"]))
-
-    if len(similarities) < 4:
+    names, sim_matrix = _get_similarity_matrix(concepts)
+    if len(names) < 5:
         return {"error": "No hay suficientes conceptos con embeddings"}
 
-    # Ordenar por similitud
-    similarities.sort(key=lambda x: x[1], reverse=True)
+    # Elegir concepto base
+    base_idx = int(_rng.integers(len(names)))
+    base = names[base_idx]
+
+    # Similitudes con todos los demás: una fila de la matriz
+    sims = sim_matrix[base_idx]
+    order = [i for i in np.argsort(-sims) if i != base_idx]
 
     # La respuesta correcta es el más similar
-    correct = similarities[0][0]
-    correct_similarity = similarities[0][1]
+    correct = names[order[0]]
+    correct_similarity = float(sims[order[0]])
 
     # Elegir 3 distractores (menos similares)
-    distractors = [s[0] for s in similarities[3:6]]
+    distractors = [names[i] for i in order[3:6]]
 
     # Mezclar opciones
     options = [correct] + distractors[:3]
-    random.shuffle(options)
+    options = [options[i] for i in _rng.permutation(len(options))]
 
     return {
         "question": f"¿Cuál es más similar a \"{base}\"?",
@@ -4,13 +4,33 @@ Cartographer - Extractor
 Extrae conceptos y relaciones de nuggets usando Claude Code CLI.
 """
 
+import hashlib
 import json
+import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 from pathlib import Path
 
-from compass import LLM_TIMEOUT
+from compass import DB_FILE, LLM_TIMEOUT
+from gemcutter import find_json
+from vault import read_nuggets
 
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+# Extracciones simultáneas en extract_all (cada una es un proceso de Claude Code)
+EXTRACT_WORKERS = 4
+
+# Cache de extracciones: {sha256(prompt)}.json
+CACHE_DIR = Path(__file__).parent / "data" / "extract_cache"
+
+# Nuggets del vault indexados por id: {ruta: (mtime_ns, {id: nugget})}
+_nuggets_index: dict = {}
 
 EXTRACTION_PROMPT = """Analiza este nugget de conocimiento y extrae los conceptos clave y sus relaciones.
 
@@ -51,12 +71,16 @@ REGLAS:
 IMPORTANTE: Responde SOLO con el JSON válido."""
 
 
-def extract_concepts_claude_code(nugget: dict) -> dict:
+def extract_concepts_claude_code(nugget: dict, ignore_cache: bool = False) -> dict:
     """
     Extrae conceptos de un nugget usando Claude Code CLI.
 
+    El resultado se cachea en disco por hash del prompt, así que un nugget
+    sin cambios no vuelve a llamar al LLM.
+
     Args:
         nugget: Diccionario con datos del nugget
+        ignore_cache: Forzar nueva extracción aunque exista en cache
 
     Returns:
         dict con concepts y relations
@@ -75,6 +99,30 @@ def extract_concepts_claude_code(nugget: dict) -> dict:
         glosario=glosario_str
     )
 
+    cache_file = CACHE_DIR / f"{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}.json"
+    if not ignore_cache and cache_file.exists():
+        try:
+            return _loads(cache_file.read_bytes())
+        except ValueError:
+            pass
+
+    extraction = _run_extraction(prompt)
+    if extraction['concepts']:
+        _write_cache(cache_file, extraction)
+
+    return extraction
+
+
+def _write_cache(cache_file: Path, extraction: dict):
+    """Escribe una extracción en cache de forma atómica."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(json.dumps(extraction, ensure_ascii=False), encoding='utf-8')
+    os.replace(tmp_file, cache_file)
+
+
+def _run_extraction(prompt: str) -> dict:
+    """Ejecuta Claude Code CLI con el prompt y parsea la respuesta."""
     try:
         result = subprocess.run(
             ["claude", "-p", prompt, "--output-format", "json"],
@@ -90,11 +138,17 @@ def extract_concepts_claude_code(nugget: dict) -> dict:
     if result.returncode != 0:
         raise Exception(f"Error Claude Code: {result.stderr}")
 
-    # Parsear respuesta
-    response = json.loads(result.stdout)
-    content = response.get("result", result.stdout)
+    # Parsear respuesta: el sobre de Claude Code trae el JSON en "result"
+    try:
+        response = _loads(result.stdout)
+    except ValueError:
+        return parse_extraction(result.stdout)
 
-    return parse_extraction(content)
+    content = response.get("result", response) if isinstance(response, dict) else response
+    if isinstance(content, dict) and 'concepts' in content:
+        return validate_extraction(content)
+
+    return parse_extraction(content if isinstance(content, str) else result.stdout)
 
 
 def parse_extraction(text: str) -> dict:
@@ -107,25 +161,18 @@ def parse_extraction(text: str) -> dict:
     Returns:
         dict con concepts y relations
     """
-    import re
-
     # Intentar parsear directamente
     try:
-        data = json.loads(text.strip())
-        if 'concepts' in data:
+        data = _loads(text.strip())
+        if isinstance(data, dict) and 'concepts' in data:
             return validate_extraction(data)
-    except json.JSONDecodeError:
+    except ValueError:
         pass
 
-    # Buscar JSON en el texto
-    match = re.search(r'\{[\s\S]*\}', text)
-    if match:
-        try:
-            data = json.loads(match.group())
-            if 'concepts' in data:
-                return validate_extraction(data)
-        except json.JSONDecodeError:
-            pass
+    # Buscar JSON en el texto (el objeto con conceptos, no cualquier {...})
+    data = find_json(text, '{', lambda obj: 'concepts' in obj)
+    if isinstance(data, dict) and 'concepts' in data:
+        return validate_extraction(data)
 
     # Fallback: estructura vacía
     print("  No se pudieron extraer conceptos")
@@ -175,6 +222,37 @@ def validate_extraction(data: dict) -> dict:
     return {"concepts": concepts, "relations": relations}
 
 
+def load_nuggets_index(vault_path: str = "vault") -> dict:
+    """
+    Devuelve {id: nugget} de la base de datos del vault, en orden de inserción.
+
+    El índice se reutiliza mientras el archivo no cambie (mismo mtime). Un
+    vault que solo tiene nuggets.json se importa a SQLite al leerlo.
+
+    Args:
+        vault_path: Ruta al vault
+
+    Returns:
+        dict {video_id: nugget}
+    """
+    db_file = Path(vault_path) / DB_FILE.name
+    if not db_file.exists() and not db_file.with_suffix(".json").exists():
+        raise Exception(f"No existe {db_file}")
+
+    key = str(db_file.resolve())
+    cached = _nuggets_index.get(key)
+    if cached and db_file.exists() and cached[0] == db_file.stat().st_mtime_ns:
+        return cached[1]
+
+    index = {}
+    for nugget in read_nuggets(db_file):
+        if nugget.get('id'):
+            index[nugget['id']] = nugget
+
+    _nuggets_index[key] = (db_file.stat().st_mtime_ns, index)
+    return index
+
+
 def extract_from_nugget(video_id: str, vault_path: str = "vault") -> dict:
     """
     Extrae conceptos de un nugget por su ID.
@@ -186,21 +264,7 @@ def extract_from_nugget(video_id: str, vault_path: str = "vault") -> dict:
     Returns:
         dict con concepts y relations
     """
-    # Cargar nuggets.json
-    nuggets_file = Path(vault_path) / "nuggets.json"
-    if not nuggets_file.exists():
-        raise Exception(f"No existe {nuggets_file}")
-
-    with open(nuggets_file, 'r', encoding='utf-8') as f:
-        nuggets = json.load(f)
-
-    # Buscar nugget
-    nugget = None
-    for n in nuggets:
-        if n.get('id') == video_id:
-            nugget = n
-            break
-
+    nugget = load_nuggets_index(vault_path).get(video_id)
     if not nugget:
         raise Exception(f"Nugget {video_id} no encontrado")
 
@@ -209,39 +273,43 @@ def extract_from_nugget(video_id: str, vault_path: str = "vault") -> dict:
     return extract_concepts_claude_code(nugget)
 
 
-def extract_all(vault_path: str = "vault") -> dict:
+def extract_all(vault_path: str = "vault", max_workers: int = EXTRACT_WORKERS) -> dict:
     """
     Extrae conceptos de todos los nuggets.
 
+    Cada extracción es una llamada independiente a Claude Code, así que se
+    lanzan en paralelo (hasta max_workers procesos a la vez).
+
     Args:
         vault_path: Ruta al vault
+        max_workers: Extracciones simultáneas
 
     Returns:
-        dict {video_id: {concepts, relations}}
+        dict {video_id: {concepts, relations}} en el orden de nuggets.json
     """
-    nuggets_file = Path(vault_path) / "nuggets.json"
-    if not nuggets_file.exists():
-        raise Exception(f"No existe {nuggets_file}")
-
-    with open(nuggets_file, 'r', encoding='utf-8') as f:
-        nuggets = json.load(f)
-
-    results = {}
-    for nugget in nuggets:
-        video_id = nugget.get('id')
-        if not video_id:
-            continue
-
+    pending = []
+    for video_id, nugget in load_nuggets_index(vault_path).items():
         # Solo procesar nuggets con contenido suficiente
         if not nugget.get('puntos_clave') and not nugget.get('glosario'):
             print(f"  Saltando {video_id}: sin contenido suficiente")
             continue
 
-        try:
-            results[video_id] = extract_concepts_claude_code(nugget)
-            print(f"  {video_id}: {len(results[video_id]['concepts'])} conceptos")
-        except Exception as e:
-            print(f"  Error en {video_id}: {e}")
-            results[video_id] = {"concepts": [], "relations": []}
+        pending.append(nugget)
 
-    return results
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(extract_concepts_claude_code, nugget): nugget['id']
+            for nugget in pending
+        }
+        for future in as_completed(futures):
+            video_id = futures[future]
+            try:
+                results[video_id] = future.result()
+                print(f"  {video_id}: {len(results[video_id]['concepts'])} conceptos")
+            except Exception as e:
+                print(f"  Error en {video_id}: {e}")
+                results[video_id] = {"concepts": [], "relations": []}
+
+    # Mantener el orden del vault: el grafo canonicaliza por orden de llegada
+    return {n['id']: results[n['id']] for n in pending}
@@ -4,14 +4,152 @@ Cartographer - Graph
 Gestiona el grafo de conocimiento unificado.
 """
 
+import heapq
 import json
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
-from typing import Optional
-from collections import defaultdict
+from typing import Iterator, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 DATA_DIR = Path(__file__).parent / "data"
 
+# Tamaño a partir del cual append_video reescribe graph.json y vacía el journal
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# Tamaño de cada trozo emitido por iter_d3_json
+D3_CHUNK_BYTES = 64 * 1024
+
+# Mapeo de sinónimos conocidos (casefold -> nombre canónico)
+_SYNONYMS = {
+    'python 3': 'Python',
+    'python3': 'Python',
+    'py': 'Python',
+    'machine learning': 'Machine Learning',
+    'ml': 'Machine Learning',
+    'deep learning': 'Deep Learning',
+    'dl': 'Deep Learning',
+    'neural network': 'Neural Network',
+    'neural networks': 'Neural Network',
+    'redes neuronales': 'Neural Network',
+    'git': 'Git',
+    'github': 'GitHub',
+    'ia': 'Artificial Intelligence',
+    'ai': 'Artificial Intelligence',
+    'inteligencia artificial': 'Artificial Intelligence',
+    'llm': 'LLM',
+    'llms': 'LLM',
+    'large language model': 'LLM',
+    'claude': 'Claude',
+    'claude code': 'Claude Code',
+    'mcp': 'MCP',
+    'model context protocol': 'MCP',
+}
+
+
+@dataclass
+class ConceptNode:
+    """
+    Concepto del grafo. Con __slots__ ocupa menos que un dict y el acceso
+    a atributos es directo.
+    """
+    __slots__ = ('name', 'type', 'importance', 'parent', 'sources', 'aliases')
+
+    name: str
+    type: str
+    importance: float
+    parent: Optional[str]
+    sources: set  # {video_id}
+    aliases: set  # {nombre original}
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'type': self.type,
+            'importance': self.importance,
+            'parent': self.parent,
+            'sources': list(self.sources),
+            'aliases': list(self.aliases)
+        }
+
+
+@dataclass
+class RelationEdge:
+    """
+    Relación dirigida entre dos conceptos ('from' es palabra reservada,
+    de ahí from_).
+    """
+    __slots__ = ('from_', 'to', 'type', 'strength', 'sources')
+
+    from_: str
+    to: str
+    type: str
+    strength: float
+    sources: set  # {video_id}
+
+    def to_dict(self) -> dict:
+        return {
+            'from': self.from_,
+            'to': self.to,
+            'type': self.type,
+            'strength': self.strength,
+            'sources': list(self.sources)
+        }
+
+
+def journal_path(path: Path) -> Path:
+    """Journal de un grafo: graph.json -> graph.journal.jsonl"""
+    return path.with_name(f"{path.stem}.journal.jsonl")
+
+
+def _d3_node(concept: ConceptNode) -> dict:
+    """Nodo D3.js de un concepto."""
+    return {
+        'id': concept.name,
+        'type': concept.type,
+        'importance': concept.importance,
+        'size': len(concept.sources),  # Tamaño = videos que lo mencionan
+        'sources': list(concept.sources)
+    }
+
+
+def _d3_link(rel: RelationEdge) -> dict:
+    """Link D3.js de una relación."""
+    return {
+        'source': rel.from_,
+        'target': rel.to,
+        'type': rel.type,
+        'strength': rel.strength
+    }
+
+
+def _intern_all(names) -> set:
+    """Set de strings internados (IDs de video, nombres de concepto)."""
+    return {sys.intern(n) for n in names}
+
+
+def _dumps(obj) -> bytes:
+    """Serializa a JSON compacto en bytes (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _json_default(obj):
+    """Serializa nodos, relaciones y sets del grafo."""
+    if isinstance(obj, (ConceptNode, RelationEdge)):
+        return obj.to_dict()
+    if isinstance(obj, set):
+        return list(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
 
 class KnowledgeGraph:
     """
@@ -20,8 +158,12 @@ class KnowledgeGraph:
 
     def __init__(self):
         self.concepts = {}  # {canonical_name: ConceptNode}
-        self.relations = []  # [{from, to, type, strength, sources}]
-        self.sources = {}  # {video_id: [concept_names]}
+        self.relations = []  # [RelationEdge]
+        self.sources = {}  # {video_id: {concept_names}}
+        self._rel_index = {}  # {(from, to, type): RelationEdge} para deduplicar en O(1)
+        self._folded_index = {}  # {nombre.casefold(): canonical_name}
+        self._video_pos = {}  # {video_id: orden de llegada}, para desempates estables
+        self._adj = {}  # {concept_name: [RelationEdge]} en ambos sentidos
 
     def add_concepts_from_video(self, video_id: str, extraction: dict):
         """
@@ -31,40 +173,47 @@ class KnowledgeGraph:
             video_id: ID del video fuente
             extraction: Resultado de extractor.extract_concepts_claude_code
         """
-        video_concepts = []
+        # Un único objeto str por video en todos los sets de sources
+        video_id = sys.intern(video_id)
+
+        # Referencias locales: evitan buscar el atributo en cada iteración
+        concepts = self.concepts
+        canonicalize = self._canonicalize
+        video_concepts = set()
 
         for concept in extraction.get('concepts', []):
             name = concept['name']
-            canonical = self._canonicalize(name)
+            canonical = canonicalize(name)
 
-            if canonical in self.concepts:
+            existing = concepts.get(canonical)
+            if existing is not None:
                 # Actualizar concepto existente
-                existing = self.concepts[canonical]
-                existing['sources'].add(video_id)
-                existing['importance'] = max(existing['importance'], concept['importance'])
+                existing.sources.add(video_id)
+                existing.importance = max(existing.importance, concept['importance'])
                 # Agregar alias si es diferente
                 if name != canonical:
-                    existing['aliases'].add(name)
+                    existing.aliases.add(name)
             else:
                 # Crear nuevo concepto
-                self.concepts[canonical] = {
-                    'name': canonical,
-                    'type': concept['type'],
-                    'importance': concept['importance'],
-                    'parent': concept.get('parent'),
-                    'sources': {video_id},
-                    'aliases': {name} if name != canonical else set()
-                }
+                concepts[canonical] = ConceptNode(
+                    name=canonical,
+                    type=concept['type'],
+                    importance=concept['importance'],
+                    parent=concept.get('parent'),
+                    sources={video_id},
+                    aliases={name} if name != canonical else set()
+                )
+                self._folded_index.setdefault(canonical.casefold(), canonical)
 
-            video_concepts.append(canonical)
+            video_concepts.add(canonical)
 
         # Agregar relaciones
         for rel in extraction.get('relations', []):
-            from_canonical = self._canonicalize(rel['from'])
-            to_canonical = self._canonicalize(rel['to'])
+            from_canonical = canonicalize(rel['from'])
+            to_canonical = canonicalize(rel['to'])
 
             # Solo si ambos conceptos existen
-            if from_canonical in self.concepts and to_canonical in self.concepts:
+            if from_canonical in concepts and to_canonical in concepts:
                 self._add_relation(
                     from_canonical,
                     to_canonical,
@@ -74,6 +223,7 @@ class KnowledgeGraph:
                 )
 
         self.sources[video_id] = video_concepts
+        self._video_pos.setdefault(video_id, len(self._video_pos))
 
     def _canonicalize(self, name: str) -> str:
         """
@@ -85,65 +235,65 @@ class KnowledgeGraph:
         Returns:
             Nombre canonicalizado
         """
-        # Normalizar a Title Case
-        canonical = name.strip()
+        canonical, folded, is_synonym = self._canonicalize_static(name)
+        if is_synonym:
+            return canonical
 
-        # Mapeo de sinónimos conocidos
-        synonyms = {
-            'python 3': 'Python',
-            'python3': 'Python',
-            'py': 'Python',
-            'machine learning': 'Machine Learning',
-            'ml': 'Machine Learning',
-            'deep learning': 'Deep Learning',
-            'dl': 'Deep Learning',
-            'neural network': 'Neural Network',
-            'neural networks': 'Neural Network',
-            'redes neuronales': 'Neural Network',
-            'git': 'Git',
-            'github': 'GitHub',
-            'ia': 'Artificial Intelligence',
-            'ai': 'Artificial Intelligence',
-            'inteligencia artificial': 'Artificial Intelligence',
-            'llm': 'LLM',
-            'llms': 'LLM',
-            'large language model': 'LLM',
-            'claude': 'Claude',
-            'claude code': 'Claude Code',
-            'mcp': 'MCP',
-            'model context protocol': 'MCP',
-        }
+        # Buscar coincidencia (sin mayúsculas) en conceptos existentes
+        return self._folded_index.get(folded) or canonical
 
-        lower = canonical.lower()
-        if lower in synonyms:
-            return synonyms[lower]
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _canonicalize_static(name: str) -> tuple:
+        """
+        Parte pura de _canonicalize (no depende del grafo), memoizada.
+
+        Returns:
+            (canonical, folded, is_synonym)
+        """
+        # Normalizar a Title Case
+        canonical = name.strip()
 
-        # Buscar coincidencia parcial en conceptos existentes
-        for existing in self.concepts:
-            if existing.lower() == lower:
-                return existing
+        # casefold() compara sin mayúsculas también fuera de ASCII (ß = ss)
+        folded = canonical.casefold()
+        synonym = _SYNONYMS.get(folded)
+        if synonym is not None:
+            return synonym, folded, True
 
-        return canonical
+        # Internado: el mismo nombre se repite en concepts, relaciones y
+        # sources, y así todas las copias son un único objeto
+        return sys.intern(canonical), folded, False
 
     def _add_relation(self, from_name: str, to_name: str, rel_type: str, strength: float, source: str):
         """
         Agrega o actualiza una relación.
         """
         # Buscar relación existente
-        for rel in self.relations:
-            if rel['from'] == from_name and rel['to'] == to_name and rel['type'] == rel_type:
-                rel['strength'] = max(rel['strength'], strength)
-                rel['sources'].add(source)
-                return
+        key = (from_name, to_name, rel_type)
+        rel = self._rel_index.get(key)
+        if rel is not None:
+            rel.strength = max(rel.strength, strength)
+            rel.sources.add(source)
+            return
 
         # Nueva relación
-        self.relations.append({
-            'from': from_name,
-            'to': to_name,
-            'type': rel_type,
-            'strength': strength,
-            'sources': {source}
-        })
+        self._index_relation(RelationEdge(
+            from_=from_name,
+            to=to_name,
+            type=rel_type,
+            strength=strength,
+            sources={source}
+        ))
+
+    def _index_relation(self, rel: RelationEdge):
+        """
+        Registra una relación nueva en la lista y en los índices.
+        """
+        self.relations.append(rel)
+        self._rel_index[(rel.from_, rel.to, rel.type)] = rel
+        self._adj.setdefault(rel.from_, []).append(rel)
+        if rel.to != rel.from_:
+            self._adj.setdefault(rel.to, []).append(rel)
 
     def get_related_videos(self, video_id: str) -> list:
         """
@@ -158,27 +308,31 @@ class KnowledgeGraph:
         if video_id not in self.sources:
             return []
 
-        my_concepts = set(self.sources[video_id])
-        related = defaultdict(lambda: {'concepts': [], 'score': 0})
+        my_concepts = self.sources[video_id]
 
-        for other_id, concepts in self.sources.items():
-            if other_id == video_id:
-                continue
+        # Índice invertido: concept.sources ya lista los videos de cada
+        # concepto, así que solo se visitan videos con algo en común
+        candidates = set()
+        for name in my_concepts:
+            candidates.update(self.concepts[name].sources)
+        candidates.discard(video_id)
 
-            shared = my_concepts & set(concepts)
-            if shared:
-                related[other_id]['concepts'] = list(shared)
+        scores = {}
+        shared_map = {}
+        for other_id in sorted(candidates, key=lambda v: self._video_pos.get(v, -1)):
+            if (shared := my_concepts & self.sources.get(other_id, set())):
                 # Score basado en cantidad y importancia
-                score = sum(self.concepts[c]['importance'] for c in shared)
-                related[other_id]['score'] = score
+                scores[other_id] = sum(self.concepts[c].importance for c in shared)
+                shared_map[other_id] = shared
 
-        # Ordenar por score
-        result = [
-            {'video_id': vid, **data}
-            for vid, data in sorted(related.items(), key=lambda x: -x[1]['score'])
-        ]
+        # Top 10 por score sin ordenar todos los candidatos; las listas de
+        # conceptos solo se crean para los ganadores
+        top = heapq.nlargest(10, scores.items(), key=itemgetter(1))
 
-        return result[:10]  # Top 10
+        return [
+            {'video_id': vid, 'concepts': list(shared_map[vid]), 'score': score}
+            for vid, score in top
+        ]
 
     def get_concept_info(self, name: str) -> Optional[dict]:
         """
@@ -196,12 +350,12 @@ class KnowledgeGraph:
 
         concept = self.concepts[canonical]
         return {
-            'name': concept['name'],
-            'type': concept['type'],
-            'importance': concept['importance'],
-            'aliases': list(concept['aliases']),
-            'sources': list(concept['sources']),
-            'parent': concept.get('parent'),
+            'name': concept.name,
+            'type': concept.type,
+            'importance': concept.importance,
+            'aliases': list(concept.aliases),
+            'sources': list(concept.sources),
+            'parent': concept.parent,
             'related': self._get_related_concepts(canonical)
         }
 
@@ -209,13 +363,14 @@ class KnowledgeGraph:
         """
         Obtiene conceptos relacionados directamente.
         """
-        related = []
-        for rel in self.relations:
-            if rel['from'] == name:
-                related.append({'name': rel['to'], 'type': rel['type'], 'strength': rel['strength']})
-            elif rel['to'] == name:
-                related.append({'name': rel['from'], 'type': rel['type'], 'strength': rel['strength']})
-        return related
+        return [
+            {
+                'name': rel.to if rel.from_ == name else rel.from_,
+                'type': rel.type,
+                'strength': rel.strength
+            }
+            for rel in self._adj.get(name, [])
+        ]
 
     def to_d3_format(self) -> dict:
         """
@@ -224,26 +379,51 @@ class KnowledgeGraph:
         Returns:
             dict con nodes y links para D3 force-directed graph
         """
-        nodes = []
-        for name, concept in self.concepts.items():
-            nodes.append({
-                'id': name,
-                'type': concept['type'],
-                'importance': concept['importance'],
-                'size': len(concept['sources']),  # Tamaño = videos que lo mencionan
-                'sources': list(concept['sources'])
-            })
-
-        links = []
+        return {
+            'nodes': [_d3_node(concept) for concept in self.concepts.values()],
+            'links': [_d3_link(rel) for rel in self.relations]
+        }
+
+    def iter_d3_json(self) -> Iterator[bytes]:
+        """
+        Genera el mismo JSON que to_d3_format, en trozos de bytes.
+
+        No construye las listas intermedias de nodos y links: cada elemento
+        se serializa y se acumula en un buffer que se emite al llenarse.
+
+        Yields:
+            Trozos de ~D3_CHUNK_BYTES del documento JSON
+        """
+        buf = bytearray(b'{"nodes":[')
+        sep = b''
+        for concept in self.concepts.values():
+            buf += sep
+            buf += _dumps(_d3_node(concept))
+            sep = b','
+            if len(buf) >= D3_CHUNK_BYTES:
+                yield bytes(buf)
+                buf.clear()
+
+        buf += b'],"links":['
+        sep = b''
         for rel in self.relations:
-            links.append({
-                'source': rel['from'],
-                'target': rel['to'],
-                'type': rel['type'],
-                'strength': rel['strength']
-            })
+            buf += sep
+            buf += _dumps(_d3_link(rel))
+            sep = b','
+            if len(buf) >= D3_CHUNK_BYTES:
+                yield bytes(buf)
+                buf.clear()
 
-        return {'nodes': nodes, 'links': links}
+        buf += b']}'
+        yield bytes(buf)
+
+    def write_d3_format(self, path: Path):
+        """
+        Escribe el grafo en formato D3.js directamente a disco.
+        """
+        with open(path, 'wb') as f:
+            for chunk in self.iter_d3_json():
+                f.write(chunk)
 
     def save(self, path: Optional[Path] = None):
         """
@@ -252,28 +432,61 @@ class KnowledgeGraph:
         path = path or DATA_DIR / "graph.json"
         path.parent.mkdir(parents=True, exist_ok=True)
 
-        # Convertir sets a listas para JSON
+        # Las estructuras vivas se serializan tal cual; nodos, relaciones y
+        # sets se convierten al vuelo en _json_default
         data = {
-            'concepts': {
-                name: {
-                    **{k: v for k, v in concept.items() if k not in ('sources', 'aliases')},
-                    'sources': list(concept['sources']),
-                    'aliases': list(concept['aliases'])
-                }
-                for name, concept in self.concepts.items()
-            },
-            'relations': [
-                {**rel, 'sources': list(rel['sources'])}
-                for rel in self.relations
-            ],
+            'concepts': self.concepts,
+            'relations': self.relations,
             'sources': self.sources
         }
 
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # graph.json se versiona: se mantiene indentado para diffs legibles
+        if orjson is not None:
+            path.write_bytes(orjson.dumps(
+                data,
+                default=_json_default,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_PASSTHROUGH_DATACLASS
+            ))
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
+
+        # El snapshot ya incluye todo lo que había en el journal
+        journal_path(path).unlink(missing_ok=True)
 
         print(f"  Grafo guardado: {len(self.concepts)} conceptos, {len(self.relations)} relaciones")
 
+    def compact(self, path: Optional[Path] = None):
+        """
+        Vuelca el grafo completo a graph.json y vacía el journal.
+        """
+        self.save(path)
+
+    def append_video(self, video_id: str, extraction: dict, path: Optional[Path] = None):
+        """
+        Agrega un video al grafo y lo persiste de forma incremental.
+
+        En vez de reescribir graph.json entero se añade una línea al journal
+        (graph.journal.jsonl), que load() reaplica. Cuando el journal crece
+        por encima de JOURNAL_COMPACT_BYTES se compacta.
+
+        Args:
+            video_id: ID del video fuente
+            extraction: Resultado de extractor.extract_concepts_claude_code
+            path: Ruta de graph.json
+        """
+        path = path or DATA_DIR / "graph.json"
+        self.add_concepts_from_video(video_id, extraction)
+
+        journal = journal_path(path)
+        journal.parent.mkdir(parents=True, exist_ok=True)
+        record = json.dumps({'video_id': video_id, 'extraction': extraction}, ensure_ascii=False)
+        with open(journal, 'a', encoding='utf-8') as f:
+            f.write(record + '\n')
+
+        if journal.stat().st_size > JOURNAL_COMPACT_BYTES:
+            self.compact(path)
+
     @classmethod
     def load(cls, path: Optional[Path] = None) -> 'KnowledgeGraph':
         """
@@ -283,48 +496,85 @@ class KnowledgeGraph:
 
         graph = cls()
 
-        if not path.exists():
-            return graph
+        if path.exists():
+            graph._load_snapshot(path)
+        graph._replay_journal(journal_path(path))
+
+        return graph
 
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+    def _load_snapshot(self, path: Path):
+        """
+        Restaura el grafo desde graph.json.
+        """
+        if orjson is not None:
+            data = orjson.loads(path.read_bytes())
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
 
         # Restaurar concepts con sets
         for name, concept in data.get('concepts', {}).items():
-            graph.concepts[name] = {
-                **concept,
-                'sources': set(concept.get('sources', [])),
-                'aliases': set(concept.get('aliases', []))
-            }
+            name = sys.intern(name)
+            self.concepts[name] = ConceptNode(
+                name=name,
+                type=concept.get('type', 'concepto'),
+                importance=concept.get('importance', 0.5),
+                parent=concept.get('parent'),
+                sources=_intern_all(concept.get('sources', [])),
+                aliases=set(concept.get('aliases', []))
+            )
+            self._folded_index.setdefault(name.casefold(), name)
 
         # Restaurar relations con sets
         for rel in data.get('relations', []):
-            graph.relations.append({
-                **rel,
-                'sources': set(rel.get('sources', []))
-            })
+            self._index_relation(RelationEdge(
+                from_=sys.intern(rel['from']),
+                to=sys.intern(rel['to']),
+                type=rel['type'],
+                strength=rel.get('strength', 0.5),
+                sources=_intern_all(rel.get('sources', []))
+            ))
+
+        self.sources = {
+            sys.intern(vid): _intern_all(concepts)
+            for vid, concepts in data.get('sources', {}).items()
+        }
+        self._video_pos = {vid: i for i, vid in enumerate(self.sources)}
 
-        graph.sources = data.get('sources', {})
+    def _replay_journal(self, journal: Path):
+        """
+        Reaplica los videos agregados después del último snapshot.
+        """
+        if not journal.exists():
+            return
 
-        return graph
+        with open(journal, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Línea a medio escribir (proceso interrumpido)
+                    continue
+                self.add_concepts_from_video(record['video_id'], record['extraction'])
 
 
-def rebuild_graph(vault_path: str = "vault") -> KnowledgeGraph:
+def rebuild_graph(vault_path: str = "vault", max_workers: Optional[int] = None) -> KnowledgeGraph:
     """
     Reconstruye el grafo completo desde todos los nuggets.
 
     Args:
         vault_path: Ruta al vault
+        max_workers: Extracciones simultáneas (None: EXTRACT_WORKERS)
 
     Returns:
         KnowledgeGraph reconstruido
     """
-    from cartographer.extractor import extract_all
+    from cartographer.extractor import extract_all, EXTRACT_WORKERS
 
     print("Reconstruyendo grafo de conocimiento...")
 
     # Extraer conceptos de todos los nuggets
-    extractions = extract_all(vault_path)
+    extractions = extract_all(vault_path, max_workers or EXTRACT_WORKERS)
 
     # Crear grafo
     graph = KnowledgeGraph()
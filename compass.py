@@ -5,20 +5,43 @@ La brújula que guía el sistema minerOS.
 
 Variables de entorno:
 - VIDEOMINE_MODEL: Modelo de Ollama (default: llama3.2)
+- VIDEOMINE_WHISPER_MODEL: Modelo de Whisper para videos sin subtítulos (default: base)
 - VIDEOMINE_MAX_CHARS: Máximo de caracteres de transcripción (default: 12000)
 - VIDEOMINE_TIMEOUT: Timeout LLM en segundos (default: 300)
 - VIDEOMINE_HOST: Host del servidor (default: 127.0.0.1)
 - VIDEOMINE_PORT: Puerto del servidor (default: 5555)
+- VIDEOMINE_DEV: 1 para usar el servidor de desarrollo de Flask en lugar de waitress (default: 0)
+- VIDEOMINE_LLM_CACHE_TTL: Vida de las respuestas LLM cacheadas en segundos (default: 604800)
 """
 
 import os
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Final
 
 
-@dataclass
+def _env_int(name: str, default: int) -> int:
+    """Lee una variable de entorno entera, con un error claro si no lo es."""
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} debe ser un número entero (recibido: {value!r})") from None
+
+
+@dataclass(frozen=True)
 class Compass:
     """Configuración de VideoMine - La brújula del sistema."""
+    # Inmutable y sin __dict__ (slots a mano: dataclass(slots=True) es 3.10+)
+    __slots__ = (
+        'base_dir', 'vault_dir', 'template_dir', 'pending_dir',
+        'db_file', 'json_file', 'index_file', 'llm_cache_file', 'meta_cache_dir',
+        'ollama_model', 'whisper_model', 'max_transcript_chars', 'llm_timeout', 'llm_cache_ttl',
+        'server_host', 'server_port', 'server_dev',
+    )
+
     # Directorios
     base_dir: Path
     vault_dir: Path      # output/ → vault/ (almacenamiento)
@@ -26,17 +49,23 @@ class Compass:
     pending_dir: Path
 
     # Archivos
-    db_file: Path        # La base de datos del vault
+    db_file: Path        # La base de datos del vault (SQLite)
+    json_file: Path      # nuggets.json: formato anterior y exportación (--export-json)
     index_file: Path     # Índice del vault
+    llm_cache_file: Path # Respuestas LLM cacheadas (traducir, expandir, mapa)
+    meta_cache_dir: Path # Metadatos de yt-dlp cacheados por video_id
 
     # LLM (Gemcutter)
     ollama_model: str
+    whisper_model: str   # Transcripción cuando no hay subtítulos (Pickaxe)
     max_transcript_chars: int
     llm_timeout: int
+    llm_cache_ttl: int
 
     # Server (Compass Web)
     server_host: str
     server_port: int
+    server_dev: bool     # Servidor de desarrollo de Flask en vez de waitress
 
     @classmethod
     def load(cls, base_dir: Path = None) -> 'Compass':
@@ -49,28 +78,40 @@ class Compass:
             vault_dir=vault,
             template_dir=base / "compass" / "templates",
             pending_dir=vault / "pending",
-            db_file=vault / "nuggets.json",  # videos.json → nuggets.json
+            db_file=vault / "nuggets.sqlite",  # videos.json → nuggets.json → nuggets.sqlite
+            json_file=vault / "nuggets.json",
             index_file=vault / "index.html",
+            llm_cache_file=vault / "llm_cache.json",
+            meta_cache_dir=vault / ".cache" / "meta",
             ollama_model=os.environ.get("VIDEOMINE_MODEL", "llama3.2"),
-            max_transcript_chars=int(os.environ.get("VIDEOMINE_MAX_CHARS", "12000")),
-            llm_timeout=int(os.environ.get("VIDEOMINE_TIMEOUT", "300")),
+            whisper_model=os.environ.get("VIDEOMINE_WHISPER_MODEL", "base"),
+            max_transcript_chars=_env_int("VIDEOMINE_MAX_CHARS", 12000),
+            llm_timeout=_env_int("VIDEOMINE_TIMEOUT", 300),
+            llm_cache_ttl=_env_int("VIDEOMINE_LLM_CACHE_TTL", 7 * 24 * 3600),
             server_host=os.environ.get("VIDEOMINE_HOST", "127.0.0.1"),
-            server_port=int(os.environ.get("VIDEOMINE_PORT", "5555")),
+            server_port=_env_int("VIDEOMINE_PORT", 5555),
+            server_dev=bool(_env_int("VIDEOMINE_DEV", 0)),
         )
 
 
 # Instancia global de configuración
-compass = Compass.load()
+compass: Final = Compass.load()
 
 # Exportar constantes para compatibilidad
-SCRIPT_DIR = compass.base_dir
-OUTPUT_DIR = compass.vault_dir
-TEMPLATE_DIR = compass.template_dir
-PENDING_DIR = compass.pending_dir
-DB_FILE = compass.db_file
-INDEX_FILE = compass.index_file
-OLLAMA_MODEL = compass.ollama_model
-MAX_TRANSCRIPT_CHARS = compass.max_transcript_chars
-LLM_TIMEOUT = compass.llm_timeout
-SERVER_HOST = compass.server_host
-SERVER_PORT = compass.server_port
+SCRIPT_DIR: Final[Path] = compass.base_dir
+OUTPUT_DIR: Final[Path] = compass.vault_dir
+TEMPLATE_DIR: Final[Path] = compass.template_dir
+PENDING_DIR: Final[Path] = compass.pending_dir
+DB_FILE: Final[Path] = compass.db_file
+JSON_FILE: Final[Path] = compass.json_file
+INDEX_FILE: Final[Path] = compass.index_file
+LLM_CACHE_FILE: Final[Path] = compass.llm_cache_file
+META_CACHE_DIR: Final[Path] = compass.meta_cache_dir
+OLLAMA_MODEL: Final[str] = compass.ollama_model
+WHISPER_MODEL: Final[str] = compass.whisper_model
+MAX_TRANSCRIPT_CHARS: Final[int] = compass.max_transcript_chars
+LLM_TIMEOUT: Final[int] = compass.llm_timeout
+LLM_CACHE_TTL: Final[int] = compass.llm_cache_ttl
+SERVER_HOST: Final[str] = compass.server_host
+SERVER_PORT: Final[int] = compass.server_port
+SERVER_DEV: Final[bool] = compass.server_dev
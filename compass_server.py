@@ -5,41 +5,243 @@ API local para gestionar el Vault de nuggets.
 Uso: python compass_server.py o python videomine.py --server
 """
 
+import hashlib
+import heapq
 import json
+import os
 import re
 import subprocess
 import threading
-import queue
+import time
+from array import array
+from collections import OrderedDict, deque
 from pathlib import Path
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Regex para validar URLs de YouTube
 YOUTUBE_URL_REGEX = re.compile(
     r'^https?://(www\.)?(youtube\.com/watch\?v=|youtu\.be/|youtube\.com/shorts/)'
 )
 
 # Importar configuración
-from compass import OUTPUT_DIR, TEMPLATE_DIR, DB_FILE, INDEX_FILE, PENDING_DIR, SERVER_HOST, SERVER_PORT
+from compass import (
+    OUTPUT_DIR, TEMPLATE_DIR, DB_FILE, INDEX_FILE, PENDING_DIR, SERVER_HOST, SERVER_PORT, SERVER_DEV,
+    LLM_CACHE_FILE, LLM_CACHE_TTL,
+)
 
-# Importar módulos minerOS
-from tunnel import scan_video, extract_subtitles, transcribe_audio
-from gemcutter import cut_with_ollama, cut_with_claude_code, parse_nugget
-from vault import load_nuggets, save_nugget, forge_html, forge_index, delete_nugget
-from pickaxe import format_duration, get_safe_filename
+# Importar módulos minerOS (tunnel y gemcutter se importan al usarse: una
+# sesión que solo consulta o exporta el vault no los carga)
+from vault import load_nuggets, save_nugget, forge_html, forge_index, delete_nugget, INDEX_DATA_NAME
+from pickaxe import format_duration, get_safe_filename, safe_title
 import cartographer
 
+def _loads(data):
+    """Parsea JSON desde str o bytes (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    """Serializa a JSON UTF-8 en bytes (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor JSON de Flask sobre orjson: jsonify y request.json sin pasar
+    por el json de la stdlib. Mantiene las claves ordenadas como Flask.
+    """
+    OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Los bytes de orjson van directos a la respuesta, sin decodificar y
+        # recodificar. Mismos argumentos que DefaultJSONProvider.response
+        # (sin depender de su método privado _prepare_response_obj)
+        if args and kwargs:
+            raise TypeError("app.json.response() takes either args or kwargs, not both")
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = list(args) or kwargs or None
+        body = orjson.dumps(obj, default=self.default, option=self.OPTIONS) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
 app = Flask(__name__, static_folder='vault')
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 CORS(app, origins=['http://localhost:5555', 'http://127.0.0.1:5555'])
 
-# Cola de progreso para SSE
+# Pasos que cierran una tarea: tras ellos no llegan más eventos
+FINAL_STEPS = ('done', 'error', 'manual')
+
+# Segundos que se conserva el canal de una tarea terminada
+PROGRESS_TTL = 600
+PROGRESS_SWEEP_INTERVAL = 60
+
+
+class ProgressChannel:
+    """
+    Eventos de progreso de una tarea: un productor (el hilo del pipeline)
+    y un consumidor (SSE o polling). Un deque acotado más un Event es más
+    ligero que queue.Queue (append/popleft son atómicos en CPython).
+    """
+    __slots__ = ('_items', '_event', 'created', 'finished_at')
+
+    def __init__(self, maxlen: int = 256):
+        self._items = deque(maxlen=maxlen)
+        self._event = threading.Event()
+        self.created = time.monotonic()
+        self.finished_at = None  # Se fija al recibir un paso final
+
+    def put(self, update: dict):
+        if update.get('step') in FINAL_STEPS:
+            self.finished_at = time.monotonic()
+        self._items.append(update)
+        self._event.set()
+
+    def drain(self) -> list:
+        """Saca todos los eventos pendientes sin bloquear."""
+        # Limpiar antes de vaciar: un put concurrente vuelve a activar el Event
+        self._event.clear()
+        updates = []
+        while True:
+            try:
+                updates.append(self._items.popleft())
+            except IndexError:
+                return updates
+
+    def wait(self, timeout: float) -> list:
+        """Espera hasta timeout a que haya eventos y los devuelve."""
+        self._event.wait(timeout)
+        return self.drain()
+
+
+# Canales de progreso por task_id
 progress_queues = {}
+_janitor_started = False
+_janitor_lock = threading.Lock()
+
+
+def _sweep_progress():
+    """Borra cada PROGRESS_SWEEP_INTERVAL los canales terminados hace más de PROGRESS_TTL."""
+    while True:
+        time.sleep(PROGRESS_SWEEP_INTERVAL)
+        now = time.monotonic()
+        # list(): add_video puede insertar mientras se recorre
+        for task_id, channel in list(progress_queues.items()):
+            if channel.finished_at is not None and now - channel.finished_at > PROGRESS_TTL:
+                progress_queues.pop(task_id, None)
+
+
+def _start_janitor():
+    global _janitor_started
+    with _janitor_lock:
+        if not _janitor_started:
+            threading.Thread(target=_sweep_progress, daemon=True).start()
+            _janitor_started = True
+
+
+class ResponseCache:
+    """
+    Caché LRU con TTL para respuestas de LLM deterministas (traducir,
+    expandir, mapa conceptual). La clave es el SHA-256 del modelo y el
+    prompt; se persiste en un JSON para sobrevivir reinicios.
+    """
+
+    def __init__(self, path: Path, ttl: int, maxsize: int = 512):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> [timestamp, value]
+        self._lock = threading.Lock()
+        # Escrituras a disco: fuera de _lock (los get no esperan al disco),
+        # de una en una y sin pisar una versión más nueva con otra más vieja
+        self._save_lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._load()
+
+    @staticmethod
+    def cache_key(*parts: str) -> str:
+        return hashlib.sha256("\0".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        """Devuelve la respuesta cacheada o None si no existe o caducó."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = [time.time(), value]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            self._version += 1
+            version = self._version
+            snapshot = dict(self._entries)
+        self._save(snapshot, version)
+
+    def _load(self):
+        try:
+            entries = _loads(self.path.read_bytes())
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        # El archivo se guarda en orden LRU (más antiguo primero)
+        for key, entry in entries.items():
+            if now - entry[0] <= self.ttl:
+                self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _save(self, snapshot: dict, version: int):
+        with self._save_lock:
+            if version < self._saved_version:
+                return  # Otro hilo ya guardó un estado posterior
+            # Escritura atómica: un crash a mitad no corrompe la caché
+            tmp = self.path.with_suffix('.tmp')
+            try:
+                tmp.write_bytes(_dumps(snapshot))
+                os.replace(tmp, self.path)
+            except OSError:
+                return  # La caché es opcional: seguir sin persistir
+            self._saved_version = version
+
+
+llm_cache = ResponseCache(LLM_CACHE_FILE, LLM_CACHE_TTL)
 
 
 def process_video_task(url: str, motor: str, task_id: str):
     """Procesa un video en background (pipeline minerOS)."""
-    q = progress_queues.get(task_id, queue.Queue())
+    from tunnel import scan_video, extract_subtitles, transcribe_audio
+    from gemcutter import cut_with_ollama, cut_with_claude_code
+
+    q = progress_queues.get(task_id) or ProgressChannel()
 
     try:
         # 1. TUNNEL: Escanear
@@ -70,10 +272,8 @@ def process_video_task(url: str, motor: str, task_id: str):
         else:
             # Modo manual - guardar transcripción y esperar
             PENDING_DIR.mkdir(parents=True, exist_ok=True)
-            (PENDING_DIR / f"{video_id}.txt").write_text(transcript)
-            (PENDING_DIR / f"{video_id}.json").write_text(
-                json.dumps(video_info, indent=2, ensure_ascii=False)
-            )
+            (PENDING_DIR / f"{video_id}.txt").write_bytes(transcript.encode('utf-8'))
+            (PENDING_DIR / f"{video_id}.json").write_bytes(_dumps(video_info, indent=True))
             q.put({
                 "step": "manual",
                 "msg": "📄 Transcripción lista",
@@ -91,7 +291,7 @@ def process_video_task(url: str, motor: str, task_id: str):
 
         OUTPUT_DIR.mkdir(exist_ok=True)
         output_file = OUTPUT_DIR / get_safe_filename(video_info['title'], video_id)
-        output_file.write_text(html)
+        output_file.write_bytes(html.encode('utf-8'))
 
         # 5. Actualizar índice
         nuggets = save_nugget(video_info, summary, output_file.name)
@@ -116,8 +316,8 @@ def index():
 
 @app.route('/<path:filename>')
 def serve_file(filename):
-    """Sirve archivos HTML desde vault/ con validación de path traversal."""
-    if not filename.endswith('.html'):
+    """Sirve archivos HTML (y los datos del índice) desde vault/ con validación de path traversal."""
+    if not filename.endswith('.html') and filename != INDEX_DATA_NAME:
         return "Not found", 404
 
     # Prevenir path traversal
@@ -152,7 +352,8 @@ def add_video():
 
     # Crear task ID
     task_id = datetime.now().strftime('%Y%m%d%H%M%S')
-    progress_queues[task_id] = queue.Queue()
+    progress_queues[task_id] = ProgressChannel()
+    _start_janitor()
 
     # Procesar en background
     thread = threading.Thread(target=process_video_task, args=(url, motor, task_id))
@@ -161,17 +362,52 @@ def add_video():
     return jsonify({"task_id": task_id})
 
 
+def coalesce_progress(updates: list) -> list:
+    """
+    Deja solo el último evento de cada paso (tunnel, pickaxe, ...), en el
+    orden en que apareció cada paso. Con polling lento el cliente recibe
+    una lista corta en vez de todos los mensajes intermedios.
+    """
+    latest = {}
+    for update in updates:
+        # Reasignar una clave existente conserva su posición en el dict
+        latest[update.get('step')] = update
+    return list(latest.values())
+
+
 @app.route('/api/progress/<task_id>', methods=['GET'])
 def get_progress(task_id):
     q = progress_queues.get(task_id)
     if not q:
         return jsonify({"error": "Task no encontrada"}), 404
 
-    updates = []
-    while not q.empty():
-        updates.append(q.get_nowait())
+    return jsonify(coalesce_progress(q.drain()))
+
+
+@app.route('/api/progress-stream/<task_id>', methods=['GET'])
+def stream_progress(task_id):
+    """Progreso de una tarea como Server-Sent Events (una sola conexión)."""
+    q = progress_queues.get(task_id)
+    if not q:
+        return jsonify({"error": "Task no encontrada"}), 404
 
-    return jsonify(updates)
+    def generate():
+        while True:
+            updates = q.wait(timeout=15)
+            if not updates:
+                # Comentario SSE: mantiene viva la conexión
+                yield b": keep-alive\n\n"
+                continue
+
+            for update in updates:
+                yield b"data: " + _dumps(update) + b"\n\n"
+                if update.get('step') in FINAL_STEPS:
+                    return
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 
 @app.route('/api/finish', methods=['POST'])
@@ -187,7 +423,9 @@ def finish_video():
     if not transcript_file.exists():
         return jsonify({"error": "Video pendiente no encontrado"}), 404
 
-    video_info = json.loads(info_file.read_text())
+    from gemcutter import parse_nugget
+
+    video_info = _loads(info_file.read_bytes())
     summary = parse_nugget(summary_json) if isinstance(summary_json, str) else summary_json
 
     # Generar HTML
@@ -195,7 +433,7 @@ def finish_video():
 
     OUTPUT_DIR.mkdir(exist_ok=True)
     output_file = OUTPUT_DIR / get_safe_filename(video_info['title'], video_id)
-    output_file.write_text(html)
+    output_file.write_bytes(html.encode('utf-8'))
 
     # Actualizar índice
     nuggets = save_nugget(video_info, summary, output_file.name)
@@ -214,16 +452,9 @@ def api_delete_video(video_id):
     return jsonify({"success": success})
 
 
-@app.route('/api/export/<video_id>', methods=['GET'])
-def export_markdown(video_id):
-    """Exporta un nugget a Markdown completo (descarga directa)."""
-    nuggets = load_nuggets()
-    nugget = next((n for n in nuggets if n['id'] == video_id), None)
-
-    if not nugget:
-        return jsonify({"error": "Nugget no encontrado"}), 404
-
-    md = f"""# {nugget['title']}
+def _generate_markdown(nugget: dict):
+    """Genera el Markdown de un nugget por secciones (para streaming)."""
+    yield f"""# {nugget['title']}
 
 > **Canal:** {nugget['channel']} | **Duración:** {nugget['duration']} | **Fecha:** {nugget['date']}
 >
@@ -244,11 +475,11 @@ def export_markdown(video_id):
     puntos = nugget.get('puntos_clave', [])
     if puntos:
         for punto in puntos:
-            md += f"- {punto}\n"
+            yield f"- {punto}\n"
     else:
-        md += "- Ver nota HTML para detalles\n"
+        yield "- Ver nota HTML para detalles\n"
 
-    md += """
+    yield """
 ---
 
 ## Código y Comandos
@@ -257,11 +488,11 @@ def export_markdown(video_id):
     comandos = nugget.get('codigo_comandos', [])
     if comandos:
         for cmd in comandos:
-            md += f"```\n{cmd}\n```\n\n"
+            yield f"```\n{cmd}\n```\n\n"
     else:
-        md += "_No hay comandos registrados_\n"
+        yield "_No hay comandos registrados_\n"
 
-    md += """
+    yield """
 ---
 
 ## Recursos Mencionados
@@ -270,11 +501,11 @@ def export_markdown(video_id):
     recursos = nugget.get('recursos_mencionados', [])
     if recursos:
         for recurso in recursos:
-            md += f"- {recurso}\n"
+            yield f"- {recurso}\n"
     else:
-        md += "_No hay recursos registrados_\n"
+        yield "_No hay recursos registrados_\n"
 
-    md += """
+    yield """
 ---
 
 ## Preguntas para Profundizar
@@ -283,11 +514,11 @@ def export_markdown(video_id):
     preguntas = nugget.get('preguntas_profundizar', [])
     if preguntas:
         for pregunta in preguntas:
-            md += f"- {pregunta}\n"
+            yield f"- {pregunta}\n"
     else:
-        md += "_No hay preguntas registradas_\n"
+        yield "_No hay preguntas registradas_\n"
 
-    md += """
+    yield """
 ---
 
 ## Glosario
@@ -296,22 +527,31 @@ def export_markdown(video_id):
     glosario = nugget.get('glosario', {})
     if glosario:
         for term, defn in glosario.items():
-            md += f"**{term}**: {defn}\n\n"
+            yield f"**{term}**: {defn}\n\n"
     else:
-        md += "_No hay términos en el glosario_\n"
+        yield "_No hay términos en el glosario_\n"
 
-    md += f"""
+    yield """
 ---
 
 _Generado con VideoMine ⛏️_
 """
 
-    safe_title = re.sub(r'[^\w\s-]', '', nugget['title'])[:50].strip()
-    filename = f"{safe_title}.md"
+
+@app.route('/api/export/<video_id>', methods=['GET'])
+def export_markdown(video_id):
+    """Exporta un nugget a Markdown completo (descarga directa)."""
+    nuggets = load_nuggets()
+    nugget = next((n for n in nuggets if n['id'] == video_id), None)
+
+    if not nugget:
+        return jsonify({"error": "Nugget no encontrado"}), 404
+
+    filename = f"{safe_title(nugget['title'])}.md"
 
     # Descarga directa con headers apropiados
     response = Response(
-        md,
+        stream_with_context(_generate_markdown(nugget)),
         mimetype='text/plain',
         headers={
             'Content-Disposition': f'attachment; filename="{filename}"',
@@ -336,7 +576,7 @@ def get_transcript(video_id):
     if not transcript:
         transcript_file = PENDING_DIR / f"{video_id}.txt"
         if transcript_file.exists():
-            transcript = transcript_file.read_text()
+            transcript = transcript_file.read_bytes().decode('utf-8')
 
     return jsonify({
         "transcript": transcript,
@@ -361,57 +601,32 @@ TEXTO:
 
 TRADUCCIÓN AL ESPAÑOL:"""
 
+    cache_key = llm_cache.cache_key("llama3.2", prompt)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return jsonify({"translation": cached})
+
+    from gemcutter import ollama_generate
+
     try:
-        result = subprocess.run(
-            ["ollama", "run", "llama3.2", prompt],
-            capture_output=True, text=True, timeout=120
-        )
-        translation = result.stdout.strip()
+        translation = ollama_generate(prompt, model="llama3.2", timeout=120)
+        if translation:
+            llm_cache.set(cache_key, translation)
         return jsonify({"translation": translation})
-    except subprocess.TimeoutExpired:
+    except TimeoutError:
         return jsonify({"error": "Traducción tardó demasiado (timeout 2 min)"}), 500
     except Exception as e:
         return jsonify({"error": "Error en traducción"}), 500
 
 
-@app.route('/api/export-html/<video_id>', methods=['GET'])
-def export_html(video_id):
-    """Exporta un nugget como HTML imprimible con campos para notas."""
-    nuggets = load_nuggets()
-    nugget = next((n for n in nuggets if n['id'] == video_id), None)
-
-    if not nugget:
-        return jsonify({"error": "Nugget no encontrado"}), 404
-
-    # Generar puntos clave con checkboxes
-    puntos_html = ""
-    for punto in nugget.get('puntos_clave', []):
-        puntos_html += f'<div class="punto"><label><input type="checkbox"> {punto}</label></div>\n'
-
-    # Generar preguntas
-    preguntas_html = ""
-    for pregunta in nugget.get('preguntas_profundizar', []):
-        preguntas_html += f'''<div class="pregunta">
-            <p>{pregunta}</p>
-            <textarea placeholder="Tu respuesta..."></textarea>
-        </div>\n'''
-
-    # Generar glosario
-    glosario_html = ""
-    for term, defn in nugget.get('glosario', {}).items():
-        glosario_html += f'<div class="termino"><strong>{term}:</strong> {defn}</div>\n'
-
-    # Generar código/comandos
-    codigo_html = ""
-    for cmd in nugget.get('codigo_comandos', []):
-        codigo_html += f'<pre class="codigo">{cmd}</pre>\n'
-
-    html = f'''<!DOCTYPE html>
+# Plantilla del HTML imprimible (format_map): la parte estática, CSS incluido,
+# no se reinterpola en cada exportación
+EXPORT_HTML_HEAD = '''<!DOCTYPE html>
 <html lang="es">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{nugget['title']} - VideoMine</title>
+    <title>{title} - VideoMine</title>
     <style>
         @media print {{
             .no-print {{ display: none; }}
@@ -588,32 +803,34 @@ def export_html(video_id):
         }}
     </style>
 </head>
-<body>
+'''
+
+EXPORT_HTML_BODY = '''<body>
     <button class="btn-print no-print" onclick="window.print()">Imprimir</button>
 
-    <h1>{nugget['title']}</h1>
+    <h1>{title}</h1>
 
     <div class="header-info">
-        <div><strong>Canal:</strong> <span>{nugget['channel']}</span></div>
-        <div><strong>Duracion:</strong> <span>{nugget['duration']}</span></div>
-        <div><strong>Fecha:</strong> <span>{nugget['date']}</span></div>
-        <div><strong>Video:</strong> <a href="{nugget['url']}" target="_blank">Ver en YouTube</a></div>
+        <div><strong>Canal:</strong> <span>{channel}</span></div>
+        <div><strong>Duracion:</strong> <span>{duration}</span></div>
+        <div><strong>Fecha:</strong> <span>{date}</span></div>
+        <div><strong>Video:</strong> <a href="{url}" target="_blank">Ver en YouTube</a></div>
     </div>
 
     <h2>Idea Principal</h2>
     <div class="idea-principal">
-        {nugget.get('idea_principal', 'N/A')}
+        {idea_principal}
     </div>
 
     <h2>Puntos Clave</h2>
-    {puntos_html if puntos_html else '<p style="color:#666">Sin puntos clave registrados</p>'}
+    {puntos}
 
-    {f'<h2>Codigo y Comandos</h2>{codigo_html}' if codigo_html else ''}
+    {codigo}
 
     <h2>Preguntas para Profundizar</h2>
-    {preguntas_html if preguntas_html else '<p style="color:#666">Sin preguntas registradas</p>'}
+    {preguntas}
 
-    {f'<h2>Glosario</h2>{glosario_html}' if glosario_html else ''}
+    {glosario}
 
     <div class="notas-section">
         <h2>Mis Notas</h2>
@@ -625,16 +842,70 @@ def export_html(video_id):
     </div>
 
     <footer>
-        Generado con VideoMine - {nugget['date']}
+        Generado con VideoMine - {date}
     </footer>
 </body>
 </html>'''
 
-    safe_title = re.sub(r'[^\w\s-]', '', nugget['title'])[:50].strip()
-    filename = f"{safe_title}.html"
+
+def _generate_html(nugget: dict):
+    """Genera el HTML imprimible de un nugget: primero el <head>, luego el cuerpo."""
+    yield EXPORT_HTML_HEAD.format_map({'title': nugget['title']})
+
+    # Generar puntos clave con checkboxes
+    puntos_html = "".join(
+        f'<div class="punto"><label><input type="checkbox"> {punto}</label></div>\n'
+        for punto in nugget.get('puntos_clave', [])
+    )
+
+    # Generar preguntas
+    preguntas_html = "".join(
+        f'''<div class="pregunta">
+            <p>{pregunta}</p>
+            <textarea placeholder="Tu respuesta..."></textarea>
+        </div>\n'''
+        for pregunta in nugget.get('preguntas_profundizar', [])
+    )
+
+    # Generar glosario
+    glosario_html = "".join(
+        f'<div class="termino"><strong>{term}:</strong> {defn}</div>\n'
+        for term, defn in nugget.get('glosario', {}).items()
+    )
+
+    # Generar código/comandos
+    codigo_html = "".join(
+        f'<pre class="codigo">{cmd}</pre>\n'
+        for cmd in nugget.get('codigo_comandos', [])
+    )
+
+    yield EXPORT_HTML_BODY.format_map({
+        'title': nugget['title'],
+        'channel': nugget['channel'],
+        'duration': nugget['duration'],
+        'date': nugget['date'],
+        'url': nugget['url'],
+        'idea_principal': nugget.get('idea_principal', 'N/A'),
+        'puntos': puntos_html if puntos_html else '<p style="color:#666">Sin puntos clave registrados</p>',
+        'codigo': f'<h2>Codigo y Comandos</h2>{codigo_html}' if codigo_html else '',
+        'preguntas': preguntas_html if preguntas_html else '<p style="color:#666">Sin preguntas registradas</p>',
+        'glosario': f'<h2>Glosario</h2>{glosario_html}' if glosario_html else '',
+    })
+
+
+@app.route('/api/export-html/<video_id>', methods=['GET'])
+def export_html(video_id):
+    """Exporta un nugget como HTML imprimible con campos para notas."""
+    nuggets = load_nuggets()
+    nugget = next((n for n in nuggets if n['id'] == video_id), None)
+
+    if not nugget:
+        return jsonify({"error": "Nugget no encontrado"}), 404
+
+    filename = f"{safe_title(nugget['title'])}.html"
 
     response = Response(
-        html,
+        stream_with_context(_generate_html(nugget)),
         mimetype='text/html',
         headers={
             'Content-Disposition': f'attachment; filename="{filename}"',
@@ -644,6 +915,118 @@ def export_html(video_id):
     return response
 
 
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _search_projection(nugget: dict) -> tuple:
+    """
+    Campos en los que busca /api/search, ya en minúsculas.
+
+    Se calcula una vez por versión del vault en lugar de llamar a .lower()
+    sobre cada transcripción en cada búsqueda. La transcripción se guarda
+    en UTF-8: `in` sobre bytes da el mismo resultado que sobre str (UTF-8
+    solo coincide en límites de carácter), la búsqueda de CPython es más
+    rápida y el texto con acentos ocupa la mitad que un str UCS-2.
+
+    Returns:
+        (title, idea, puntos, transcript, glosario, channel); puntos es una
+        tupla, transcript son bytes y glosario una tupla de pares
+        (término, definición)
+    """
+    return (
+        nugget.get('title', '').lower(),
+        nugget.get('idea_principal', '').lower(),
+        tuple(punto.lower() for punto in nugget.get('puntos_clave', [])),
+        nugget.get('transcript', '').lower().encode('utf-8'),
+        tuple((term.lower(), defn.lower()) for term, defn in nugget.get('glosario', {}).items()),
+        nugget.get('channel', '').lower(),
+    )
+
+
+class SearchIndex:
+    """
+    Índice invertido de trigramas para /api/search.
+
+    Solo filtra candidatos: un nugget cuyo texto contiene la consulta
+    contiene todos sus trigramas, así que el resultado es un superconjunto
+    exacto y la puntuación sigue usando `in` sobre los campos. Guarda
+    también las proyecciones en minúsculas de cada nugget. Se reconstruye
+    cuando load_nuggets devuelve otra lista (el vault cambió).
+    """
+    __slots__ = ('_state', '_lock')
+
+    def __init__(self):
+        # (lista indexada, trigrama -> array de posiciones, proyecciones)
+        self._state = (None, {}, [])
+        self._lock = threading.Lock()
+
+    def _index_for(self, nuggets: list) -> tuple:
+        state = self._state
+        if state[0] is nuggets:
+            return state
+        with self._lock:
+            state = self._state
+            if state[0] is not nuggets:
+                postings = {}
+                projections = []
+                for i, nugget in enumerate(nuggets):
+                    title, idea, puntos, transcript, glosario, channel = lc = _search_projection(nugget)
+                    projections.append(lc)
+                    grams = _trigrams(title) | _trigrams(idea) | _trigrams(channel)
+                    grams |= _trigrams(transcript.decode('utf-8'))
+                    for punto in puntos:
+                        grams |= _trigrams(punto)
+                    for term, defn in glosario:
+                        grams |= _trigrams(term)
+                        grams |= _trigrams(defn)
+                    for gram in grams:
+                        posting = postings.get(gram)
+                        if posting is None:
+                            posting = postings[gram] = array('I')
+                        posting.append(i)
+                state = self._state = (nuggets, postings, projections)
+            return state
+
+    def candidates(self, nuggets: list, query: str) -> list:
+        """
+        Nuggets que pueden contener query, en el orden original.
+
+        Args:
+            nuggets: Lista devuelta por load_nuggets
+            query: Consulta en minúsculas
+
+        Returns:
+            Lista de pares (nugget, proyección en minúsculas); todos los
+            nuggets si la consulta es muy corta para tener trigramas
+        """
+        _, postings, projections = self._index_for(nuggets)
+        grams = _trigrams(query)
+        if not grams:
+            return list(zip(nuggets, projections))
+
+        lists = []
+        for gram in grams:
+            posting = postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+
+        ids = set(lists[0])
+        for posting in lists[1:]:
+            ids.intersection_update(posting)
+            if not ids:
+                return []
+        return [(nuggets[i], projections[i]) for i in sorted(ids)]
+
+
+search_index = SearchIndex()
+
+# Resultados devueltos por /api/search
+SEARCH_LIMIT = 20
+
+
 @app.route('/api/search', methods=['GET'])
 def search_videos():
     """Busca en títulos, transcripciones y contenido de nuggets."""
@@ -652,65 +1035,77 @@ def search_videos():
     if not query or len(query) < 2:
         return jsonify({"results": [], "query": query})
 
-    nuggets = load_nuggets()
-    results = []
+    candidates = search_index.candidates(load_nuggets(), query)
+    query_bytes = query.encode('utf-8')
+    top = []  # min-heap de (score, -posición, nugget, matches) con los mejores SEARCH_LIMIT
+    total = 0
 
-    for nugget in nuggets:
+    for pos, (nugget, (title, idea, puntos, transcript, glosario, channel)) in enumerate(candidates):
         score = 0
         matches = []
 
         # Buscar en título (peso alto)
-        if query in nugget.get('title', '').lower():
+        if query in title:
             score += 10
             matches.append("título")
 
         # Buscar en idea principal
-        if query in nugget.get('idea_principal', '').lower():
+        if query in idea:
             score += 5
             matches.append("idea principal")
 
         # Buscar en puntos clave
-        for punto in nugget.get('puntos_clave', []):
-            if query in punto.lower():
+        for punto in puntos:
+            if query in punto:
                 score += 3
                 matches.append("puntos clave")
                 break
 
-        # Buscar en transcripción
-        transcript = nugget.get('transcript', '')
-        if query in transcript.lower():
-            score += 2
-            matches.append(f"transcripción")
-
         # Buscar en glosario
-        for term, defn in nugget.get('glosario', {}).items():
-            if query in term.lower() or query in defn.lower():
+        for term, defn in glosario:
+            if query in term or query in defn:
                 score += 4
                 matches.append("glosario")
                 break
 
         # Buscar en canal
-        if query in nugget.get('channel', '').lower():
+        if query in channel:
             score += 2
             matches.append("canal")
 
-        if score > 0:
-            results.append({
-                "id": nugget['id'],
-                "title": nugget['title'],
-                "channel": nugget['channel'],
-                "thumbnail": nugget.get('thumbnail', ''),
-                "file": nugget['file'],
-                "score": score,
-                "matches": list(set(matches))
-            })
-
-    results.sort(key=lambda x: x['score'], reverse=True)
+        # Buscar en transcripción (el campo grande): solo si hace falta para
+        # contar el nugget o si sus +2 aún pueden meterlo en el top
+        if score == 0 or len(top) < SEARCH_LIMIT or score + 2 > top[0][0]:
+            if query_bytes in transcript:
+                score += 2
+                matches.append("transcripción")
+
+        if score == 0:
+            continue
+        total += 1
+
+        # A igual score gana el nugget anterior (como el sort estable de antes)
+        entry = (score, -pos, nugget, matches)
+        if len(top) < SEARCH_LIMIT:
+            heapq.heappush(top, entry)
+        elif entry[:2] > top[0][:2]:
+            heapq.heapreplace(top, entry)
+
+    top.sort(key=lambda entry: entry[:2], reverse=True)
+    results = [{
+        "id": nugget['id'],
+        "title": nugget['title'],
+        "channel": nugget['channel'],
+        "thumbnail": nugget.get('thumbnail', ''),
+        "file": nugget['file'],
+        "score": score,
+        "matches": list(set(matches))
+    } for score, _, nugget, matches in top]
 
     return jsonify({
-        "results": results[:20],
+        "results": results,
         "query": query,
-        "total": len(results)
+        "total": total
     })
 
 
@@ -750,8 +1145,7 @@ def export_anki(video_id):
 
     tsv_content = "\n".join(cards)
 
-    safe_title = re.sub(r'[^\w\s-]', '', nugget['title'])[:30].strip()
-    filename = f"anki_{safe_title}.txt"
+    filename = f"anki_{safe_title(nugget['title'], 30)}.txt"
 
     response = Response(
         tsv_content,
@@ -820,8 +1214,11 @@ Reglas:
     # Detectar si usar Claude Code o Ollama
     use_claude = request.args.get('engine', 'claude') == 'claude'
 
+    cache_key = llm_cache.cache_key("claude" if use_claude else "llama3.2", prompt)
+
     try:
-        if use_claude:
+        response = llm_cache.get(cache_key)
+        if response is None and use_claude:
             # Usar Claude Code CLI
             result = subprocess.run(
                 ["claude", "-p", prompt, "--output-format", "json"],
@@ -833,18 +1230,17 @@ Reglas:
             # Parsear respuesta de Claude Code
             claude_response = json.loads(result.stdout)
             response = claude_response.get("result", result.stdout)
-        else:
+        elif response is None:
             # Fallback a Ollama
-            result = subprocess.run(
-                ["ollama", "run", "llama3.2", prompt],
-                capture_output=True, text=True, timeout=60
-            )
-            response = result.stdout.strip()
+            from gemcutter import ollama_generate
+            response = ollama_generate(prompt, model="llama3.2", timeout=60)
 
         # Extraer JSON de la respuesta
-        json_match = re.search(r'\{[\s\S]*\}', response)
-        if json_match:
-            map_data = json.loads(json_match.group())
+        from gemcutter import find_json
+        map_data = find_json(response, '{', lambda obj: 'nodes' in obj)
+        if map_data is not None and 'nodes' in map_data:
+            # Solo se cachea un mapa válido: uno sin nodos se volvería a servir hasta el TTL
+            llm_cache.set(cache_key, response)
             # Añadir puntos completos para tooltip
             for node in map_data.get('nodes', []):
                 idx = node.get('id', 0)
@@ -856,7 +1252,7 @@ Reglas:
 
     except json.JSONDecodeError as e:
         return jsonify({"error": f"Error parseando JSON: {str(e)}"}), 500
-    except subprocess.TimeoutExpired:
+    except (subprocess.TimeoutExpired, TimeoutError):
         return jsonify({"error": "Timeout - el LLM tardó demasiado"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -870,8 +1266,8 @@ Reglas:
 def get_knowledge_graph():
     """Obtiene el grafo de conocimiento en formato D3.js."""
     try:
-        data = cartographer.get_graph_data()
-        return jsonify(data)
+        # Se emite en trozos, sin materializar las listas de nodos y links
+        return Response(cartographer.iter_graph_data(), mimetype='application/json')
     except Exception as e:
         return jsonify({"error": str(e), "nodes": [], "links": []}), 500
 
@@ -1078,14 +1474,19 @@ Tu tarea:
 
 Responde en español, de forma concisa pero completa (máximo 3-4 párrafos)."""
 
+    cache_key = llm_cache.cache_key("llama3.2", prompt)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return jsonify({"expansion": cached, "punto": punto})
+
+    from gemcutter import ollama_generate
+
     try:
-        result = subprocess.run(
-            ["ollama", "run", "llama3.2", prompt],
-            capture_output=True, text=True, timeout=60
-        )
-        expansion = result.stdout.strip()
+        expansion = ollama_generate(prompt, model="llama3.2", timeout=60)
+        if expansion:
+            llm_cache.set(cache_key, expansion)
         return jsonify({"expansion": expansion, "punto": punto})
-    except subprocess.TimeoutExpired:
+    except TimeoutError:
         return jsonify({"error": "Timeout - Ollama tardó demasiado"}), 500
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1107,7 +1508,19 @@ def run_server(port=None, host=None):
 ║  Ctrl+C para detener                                      ║
 ╚═══════════════════════════════════════════════════════════╝
 """)
-    app.run(host=host, port=port, debug=False, threaded=True)
+    if SERVER_DEV:
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+
+    try:
+        from waitress import serve
+    except ImportError:
+        print("⚠️  waitress no instalado (pip install waitress), usando el servidor de desarrollo")
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+
+    # Cada stream SSE de progreso ocupa un hilo mientras dura la tarea
+    serve(app, host=host, port=port, threads=16, connection_limit=200)
 
 
 if __name__ == '__main__':
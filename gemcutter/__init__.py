@@ -5,51 +5,264 @@ Clasificador y resumidor con LLMs.
 Convierte transcripciones en "gemas" de conocimiento estructurado.
 """
 
+import asyncio
+import http.client
 import json
+import queue
 import re
+import socket
 import subprocess
+import threading
+import time
+from contextlib import contextmanager
 from typing import Optional
 
 from compass import OLLAMA_MODEL, MAX_TRANSCRIPT_CHARS, LLM_TIMEOUT
 
+# orjson (C) parsea las respuestas del LLM sin el tokenizador de json;
+# su JSONDecodeError hereda del de json, así que los except no cambian
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
 
-def craft_prompt(transcript: str, video_info: dict) -> str:
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+CLAUDE_MAX_TOKENS = 2000
+BATCH_POLL_MAX_SECONDS = 60  # Espera máxima entre consultas al estado de un batch
+NUGGETS_PER_PROMPT = 4  # Videos por prompt en cut_many_with_claude_code
+
+# Dentro de un bloque JSON: cadenas completas (con sus escapes) y corchetes
+JSON_TOKEN_REGEX = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+
+OLLAMA_HOST = "localhost"
+OLLAMA_PORT = 11434
+OLLAMA_KEEP_ALIVE = "30m"  # Mantiene el modelo cargado entre peticiones
+OLLAMA_POOL_SIZE = 16  # Conexiones simultáneas máximas a Ollama
+OLLAMA_NUM_CTX = 8192  # Contexto para resumir: cabe una transcripción de MAX_TRANSCRIPT_CHARS
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones HTTP keep-alive a un mismo host.
+
+    Compartido por todos los hilos (servidor, extracción, embeddings): como
+    mucho maxsize conexiones abiertas a la vez, y las libres se reutilizan
+    en orden LIFO para tomar siempre la más reciente (la que Ollama aún no
+    ha cerrado). http.client no es thread-safe, así que cada conexión la
+    usa un solo hilo mientras está prestada.
     """
-    Genera el prompt para el LLM.
+
+    def __init__(self, host: str, port: int, maxsize: int):
+        self.host = host
+        self.port = port
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(maxsize)
+
+    @contextmanager
+    def connection(self, timeout: float):
+        """
+        Presta una conexión; se devuelve al pool si el bloque termina bien
+        y se cierra si lanza una excepción (estado HTTP desconocido).
+        """
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+            else:
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+
+# Todo el tráfico HTTP hacia Ollama pasa por aquí
+ollama_pool = ConnectionPool(OLLAMA_HOST, OLLAMA_PORT, OLLAMA_POOL_SIZE)
+
+
+def _generate_on(conn: http.client.HTTPConnection, body: bytes, deadline: float, timeout: float) -> str:
+    conn.request("POST", "/api/generate", body, {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+
+    if response.status != 200:
+        detail = response.read().decode('utf-8', errors='replace')
+        raise Exception(f"Error con Ollama: HTTP {response.status} {detail}")
+
+    chunks = []
+    # Una línea JSON por fragmento: {"response": "...", "done": false}
+    for line in response:
+        if not line.strip():
+            continue
+        message = _loads(line)
+        if "error" in message:
+            raise Exception(f"Error con Ollama: {message['error']}")
+        chunks.append(message.get("response", ""))
+        if message.get("done"):
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Ollama tardó demasiado en responder (timeout {timeout}s)")
+    # Consumir el final del chunked encoding para poder reutilizar la conexión
+    response.read()
+    return "".join(chunks)
+
+
+def ollama_generate(prompt: str, model: str = OLLAMA_MODEL, timeout: float = LLM_TIMEOUT,
+                    options: Optional[dict] = None, json_format: bool = False) -> str:
+    """
+    Genera texto con la API HTTP de Ollama (/api/generate) en streaming.
+
+    Usa una conexión keep-alive de ollama_pool y pide a Ollama que mantenga
+    el modelo cargado (keep_alive), evitando el arranque de `ollama run` y
+    la recarga del modelo en cada llamada.
 
     Args:
-        transcript: Transcripción del video
-        video_info: Metadatos del video
+        prompt: Prompt completo para el modelo
+        model: Modelo de Ollama
+        timeout: Segundos máximos para la respuesta completa
+        options: Opciones del modelo (num_ctx, temperature, ...)
+        json_format: Restringe la salida a JSON válido (format: "json")
 
     Returns:
-        Prompt estructurado para el LLM
+        Respuesta del modelo sin espacios en los extremos
+
+    Raises:
+        TimeoutError: si la respuesta completa tarda más de timeout
     """
-    return f"""Analiza esta transcripción de un video tutorial y genera un resumen estructurado.
+    payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if options:
+        payload["options"] = options
+    if json_format:
+        payload["format"] = "json"
+    body = json.dumps(payload).encode('utf-8')
+    deadline = time.monotonic() + timeout
+
+    # Un reintento si el servidor cerró la conexión reutilizada
+    for attempt in range(2):
+        try:
+            with ollama_pool.connection(timeout) as conn:
+                return _generate_on(conn, body, deadline, timeout).strip()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            if attempt:
+                raise
+        except socket.timeout:
+            raise TimeoutError(f"Ollama tardó demasiado en responder (timeout {timeout}s)")
 
-TÍTULO: {video_info.get('title', 'Sin título')}
-CANAL: {video_info.get('channel', 'Desconocido')}
-DURACIÓN: {video_info.get('duration', 0)} segundos
 
-TRANSCRIPCIÓN:
-{transcript[:MAX_TRANSCRIPT_CHARS]}
+# Partes fijas del prompt de resumen, construidas una sola vez
+PROMPT_HEAD = "Analiza esta transcripción de un video tutorial y genera un resumen estructurado.\n\n"
+PROMPT_TAIL = """
 
 Genera un JSON con esta estructura exacta (sin texto adicional, solo el JSON):
-{{
+{
     "idea_principal": "Una o dos oraciones con la idea central del video",
     "puntos_clave": ["punto 1", "punto 2", "punto 3"],
     "codigo_comandos": ["comando o código mencionado"],
     "recursos_mencionados": ["recurso o herramienta mencionada"],
     "preguntas_profundizar": ["pregunta para seguir aprendiendo"],
-    "glosario": {{"término técnico": "definición breve"}}
-}}
+    "glosario": {"término técnico": "definición breve"}
+}
 
 IMPORTANTE: Responde SOLO con el JSON válido, sin explicaciones."""
 
+# Claude API: las instrucciones van en system con cache_control, así el
+# prefijo común se reutiliza entre videos. Anthropic solo cachea prefijos
+# de 1024 tokens o más; por debajo la marca se ignora sin error.
+CLAUDE_SYSTEM = [{
+    "type": "text",
+    "text": PROMPT_HEAD + PROMPT_TAIL.lstrip("\n"),
+    "cache_control": {"type": "ephemeral"},
+}]
+
+
+def _video_block(transcript: str, video_info: dict) -> str:
+    """Parte variable del prompt: metadatos y transcripción de un video."""
+    return "".join((
+        "TÍTULO: ", str(video_info.get('title', 'Sin título')),
+        "\nCANAL: ", str(video_info.get('channel', 'Desconocido')),
+        "\nDURACIÓN: ", str(video_info.get('duration', 0)), " segundos",
+        "\n\nTRANSCRIPCIÓN:\n", transcript[:MAX_TRANSCRIPT_CHARS],
+    ))
+
+
+def craft_prompt(transcript: str, video_info: dict) -> str:
+    """
+    Genera el prompt para el LLM.
+
+    Args:
+        transcript: Transcripción del video
+        video_info: Metadatos del video
+
+    Returns:
+        Prompt estructurado para el LLM
+    """
+    return "".join((PROMPT_HEAD, _video_block(transcript, video_info), PROMPT_TAIL))
+
+
+def _claude_request(transcript: str, video_info: dict) -> dict:
+    """Parámetros de messages.create para resumir un video con la API de Claude."""
+    return {
+        "model": CLAUDE_MODEL,
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "system": CLAUDE_SYSTEM,
+        "messages": [{"role": "user", "content": _video_block(transcript, video_info)}],
+    }
+
+
+def craft_batch_prompt(items: list) -> str:
+    """
+    Genera un único prompt para resumir varios videos a la vez.
+
+    Comparten la llamada y las instrucciones; la respuesta es un array JSON
+    con un objeto por video identificado por su id.
+
+    Args:
+        items: Lista de pares (transcript, video_info)
+
+    Returns:
+        Prompt estructurado para el LLM
+    """
+    videos = "\n\n".join(
+        f"=== VIDEO {video_info['id']} ===\n" + _video_block(transcript, video_info)
+        for transcript, video_info in items
+    )
+
+    return f"""Analiza estas {len(items)} transcripciones de videos tutoriales y genera un resumen estructurado de cada una.
+
+{videos}
+
+Genera un array JSON con un objeto por video, en el mismo orden, con esta estructura exacta (sin texto adicional, solo el JSON):
+[
+    {{
+        "id": "ID del video (el que aparece tras === VIDEO)",
+        "idea_principal": "Una o dos oraciones con la idea central del video",
+        "puntos_clave": ["punto 1", "punto 2", "punto 3"],
+        "codigo_comandos": ["comando o código mencionado"],
+        "recursos_mencionados": ["recurso o herramienta mencionada"],
+        "preguntas_profundizar": ["pregunta para seguir aprendiendo"],
+        "glosario": {{"término técnico": "definición breve"}}
+    }}
+]
+
+IMPORTANTE: Responde SOLO con el array JSON válido, sin explicaciones."""
+
 
 def cut_with_ollama(transcript: str, video_info: dict) -> dict:
     """
     Usa Ollama (local) para resumir.
 
+    Va por la API HTTP (ollama_generate) en modo JSON: el servidor mantiene
+    el modelo cargado entre videos y la salida siempre es JSON parseable.
+
     Args:
         transcript: Transcripción del video
         video_info: Metadatos del video
@@ -59,17 +272,8 @@ def cut_with_ollama(transcript: str, video_info: dict) -> dict:
     """
     prompt = craft_prompt(transcript, video_info)
 
-    cmd = ["ollama", "run", OLLAMA_MODEL, prompt]
-
-    try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=LLM_TIMEOUT)
-    except subprocess.TimeoutExpired:
-        raise Exception(f"Ollama tardó demasiado en responder (timeout {LLM_TIMEOUT}s)")
-
-    if result.returncode != 0:
-        raise Exception(f"Error con Ollama: {result.stderr}")
-
-    return parse_nugget(result.stdout)
+    output = ollama_generate(prompt, options={"num_ctx": OLLAMA_NUM_CTX}, json_format=True)
+    return parse_nugget(output)
 
 
 def cut_with_claude(transcript: str, video_info: dict) -> dict:
@@ -86,13 +290,7 @@ def cut_with_claude(transcript: str, video_info: dict) -> dict:
     import anthropic
 
     client = anthropic.Anthropic()
-    prompt = craft_prompt(transcript, video_info)
-
-    response = client.messages.create(
-        model="claude-sonnet-4-20250514",
-        max_tokens=2000,
-        messages=[{"role": "user", "content": prompt}]
-    )
+    response = client.messages.create(**_claude_request(transcript, video_info))
 
     return parse_nugget(response.content[0].text)
 
@@ -108,8 +306,42 @@ def cut_with_claude_code(transcript: str, video_info: dict) -> dict:
     Returns:
         dict con el resumen estructurado
     """
-    prompt = craft_prompt(transcript, video_info)
+    return parse_nugget(_run_claude_code(craft_prompt(transcript, video_info)))
+
+
+def cut_many_with_claude_code(items: list) -> dict:
+    """
+    Resume varios videos con una sola llamada a Claude Code CLI.
+
+    Agrupa hasta NUGGETS_PER_PROMPT videos por prompt: el arranque del CLI
+    y las instrucciones se pagan una vez por grupo. Los videos que falten
+    en la respuesta se resumen uno a uno.
 
+    Args:
+        items: Lista de pares (transcript, video_info)
+
+    Returns:
+        dict video_id -> resumen estructurado
+    """
+    summaries = {}
+    for start in range(0, len(items), NUGGETS_PER_PROMPT):
+        group = items[start:start + NUGGETS_PER_PROMPT]
+        if len(group) == 1:
+            transcript, video_info = group[0]
+            summaries[video_info['id']] = cut_with_claude_code(transcript, video_info)
+            continue
+
+        found = parse_nuggets_array(_run_claude_code(craft_batch_prompt(group)))
+        for transcript, video_info in group:
+            summary = found.get(video_info['id'])
+            if summary is None:
+                summary = cut_with_claude_code(transcript, video_info)
+            summaries[video_info['id']] = summary
+    return summaries
+
+
+def _run_claude_code(prompt: str) -> str:
+    """Ejecuta Claude Code CLI y devuelve el texto de la respuesta."""
     try:
         result = subprocess.run(
             ["claude", "-p", prompt, "--output-format", "json"],
@@ -124,8 +356,120 @@ def cut_with_claude_code(transcript: str, video_info: dict) -> dict:
         raise Exception(f"Error con Claude Code: {result.stderr}")
 
     # El output es JSON con estructura {"result": "..."}
-    response = json.loads(result.stdout)
-    return parse_nugget(response.get("result", result.stdout))
+    response = _loads(result.stdout)
+    return response.get("result", result.stdout)
+
+
+def cut_batch_with_claude(items: list) -> dict:
+    """
+    Resume varios videos con la Message Batches API de Claude.
+
+    Un batch cuesta la mitad que las mismas peticiones una a una y no
+    compite con el límite de peticiones por minuto, a cambio de latencia
+    (minutos u horas): pensado para cargas masivas sin prisa.
+
+    Args:
+        items: Lista de pares (transcript, video_info)
+
+    Returns:
+        dict video_id -> resumen estructurado (solo los que terminaron bien)
+    """
+    import anthropic
+
+    client = anthropic.Anthropic()
+
+    # custom_id debe ser único dentro del batch
+    requests = {}
+    for transcript, video_info in items:
+        requests[video_info['id']] = {
+            "custom_id": video_info['id'],
+            "params": _claude_request(transcript, video_info),
+        }
+
+    batch = client.messages.batches.create(requests=list(requests.values()))
+    print(f"  📦 Batch {batch.id}: {len(requests)} videos enviados")
+
+    # Backoff exponencial hasta BATCH_POLL_MAX_SECONDS entre consultas
+    delay = 5
+    while batch.processing_status != "ended":
+        time.sleep(delay)
+        delay = min(delay * 2, BATCH_POLL_MAX_SECONDS)
+        batch = client.messages.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"  ⏳ Batch {batch.id}: {counts.succeeded + counts.errored} / {len(requests)} procesados")
+
+    summaries = {}
+    for entry in client.messages.batches.results(batch.id):
+        if entry.result.type == "succeeded":
+            summaries[entry.custom_id] = parse_nugget(entry.result.message.content[0].text)
+        else:
+            print(f"  ⚠️  {entry.custom_id}: {entry.result.type}")
+    return summaries
+
+
+async def acut_with_ollama(transcript: str, video_info: dict) -> dict:
+    """
+    Versión asíncrona de cut_with_ollama: la llamada bloqueante corre en un
+    hilo para poder solapar varios videos. Ollama solo atiende peticiones en
+    paralelo si el servidor arrancó con OLLAMA_NUM_PARALLEL > 1.
+    """
+    return await asyncio.to_thread(cut_with_ollama, transcript, video_info)
+
+
+async def acut_with_claude(transcript: str, video_info: dict) -> dict:
+    """Versión asíncrona de cut_with_claude (anthropic.AsyncAnthropic)."""
+    import anthropic
+
+    client = anthropic.AsyncAnthropic()
+    response = await client.messages.create(**_claude_request(transcript, video_info))
+
+    return parse_nugget(response.content[0].text)
+
+
+def find_json(text: str, opener: str = '{', accept=None):
+    """
+    Busca bloques JSON equilibrados ({...} o [...]) dentro de texto libre.
+
+    A diferencia de tomar del primer '{' al último '}', cuenta la
+    profundidad de corchetes (ignorando los que van dentro de cadenas), así
+    que las llaves sueltas que el LLM escriba antes o después no estropean
+    el JSON. Si un bloque no parsea o accept lo rechaza, se prueba con el
+    siguiente, empezando por los que lleva dentro.
+
+    Args:
+        text: Respuesta del LLM
+        opener: '{' para objetos, '[' para arrays
+        accept: Función que decide si un bloque parseado es el buscado
+
+    Returns:
+        El primer bloque aceptado; si ninguno lo es, el primero que parsea;
+        None si no hay JSON válido
+    """
+    closer = '}' if opener == '{' else ']'
+    fallback = None
+
+    start = text.find(opener)
+    while start != -1:
+        depth = 0
+        for match in JSON_TOKEN_REGEX.finditer(text, start):
+            token = match.group()
+            if token == opener:
+                depth += 1
+            elif token == closer:
+                depth -= 1
+                if depth == 0:
+                    try:
+                        value = _loads(text[start:match.end()])
+                    except json.JSONDecodeError:
+                        break
+                    if accept is None or accept(value):
+                        return value
+                    if fallback is None:
+                        fallback = value
+                    break
+        start = text.find(opener, start + 1)
+
+    return fallback
 
 
 def parse_nugget(text: str) -> dict:
@@ -141,17 +485,14 @@ def parse_nugget(text: str) -> dict:
     """
     # Intentar parsear directamente
     try:
-        return json.loads(text.strip())
+        return _loads(text.strip())
     except json.JSONDecodeError:
         pass
 
-    # Buscar JSON en el texto
-    match = re.search(r'\{[\s\S]*\}', text)
-    if match:
-        try:
-            return json.loads(match.group())
-        except json.JSONDecodeError:
-            pass
+    # Buscar JSON en el texto, prefiriendo el objeto que parece un nugget
+    nugget = find_json(text, '{', lambda obj: 'idea_principal' in obj)
+    if nugget is not None:
+        return nugget
 
     # Fallback: estructura vacía
     print("  ⚠️  No se pudo parsear JSON, usando estructura básica")
@@ -163,3 +504,31 @@ def parse_nugget(text: str) -> dict:
         "preguntas_profundizar": [],
         "glosario": {}
     }
+
+
+def parse_nuggets_array(text: str) -> dict:
+    """
+    Extrae el array JSON de una respuesta a craft_batch_prompt.
+
+    Args:
+        text: Respuesta del LLM
+
+    Returns:
+        dict video_id -> resumen estructurado (vacío si no se pudo parsear)
+    """
+    try:
+        entries = _loads(text.strip())
+    except json.JSONDecodeError:
+        entries = find_json(
+            text, '[', lambda items: any(isinstance(e, dict) and 'id' in e for e in items)
+        )
+
+    if not isinstance(entries, list):
+        print("  ⚠️  No se pudo parsear el array JSON del lote")
+        return {}
+
+    summaries = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('id') is not None:
+            summaries[str(entry.pop('id'))] = entry
+    return summaries
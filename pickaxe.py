@@ -5,6 +5,26 @@ Herramientas para extraer información de videos.
 """
 
 import re
+from functools import lru_cache
+from itertools import groupby
+from pathlib import Path
+from typing import Iterable, Iterator, Union
+
+# Caracteres no permitidos en nombres de archivo
+TITLE_SANITIZER_REGEX = re.compile(r'[^\w\s-]')
+# Mismo filtro para títulos ASCII: bytes.translate borra estos bytes en C
+TITLE_SANITIZER_DELETE = bytes(c for c in range(128) if TITLE_SANITIZER_REGEX.match(chr(c)))
+
+# Línea de tiempos que abre cada cue
+VTT_TIMING_REGEX = re.compile(r'^.*-->.*$', re.MULTILINE)
+# Líneas VTT sin texto: cabeceras, tiempos (-->) e índices numéricos
+VTT_NOISE_REGEX = re.compile(
+    r'^(?:WEBVTT|Kind:|Language:).*|^.*-->.*|^[^\S\n]*\d+[^\S\n]*$', re.MULTILINE
+)
+# Etiquetas en línea (<c>, <00:00:01.000>, ...)
+VTT_TAG_REGEX = re.compile(r'<[^>\n]+>')
+# Líneas con algo de texto
+VTT_LINE_REGEX = re.compile(r'[^\n]*\S[^\n]*')
 
 
 def format_duration(seconds: int) -> str:
@@ -24,30 +44,73 @@ def get_safe_filename(title: str, video_id: str, extension: str = "html") -> str
     Returns:
         Nombre de archivo seguro (nugget_TITLE_ID.ext)
     """
-    safe_title = re.sub(r'[^\w\s-]', '', title)[:50].strip()
-    return f"nugget_{safe_title}_{video_id}.{extension}"
-
-
-def clean_vtt(vtt_content: str) -> str:
-    """Limpia el formato VTT y devuelve texto plano."""
-    lines = []
-    for line in vtt_content.split('\n'):
-        if line.startswith('WEBVTT') or line.startswith('Kind:') or line.startswith('Language:'):
-            continue
-        if '-->' in line:
-            continue
-        if re.match(r'^\d+$', line.strip()):
-            continue
-        if line.strip():
-            clean = re.sub(r'<[^>]+>', '', line)
-            lines.append(clean.strip())
-
-    # Eliminar duplicados consecutivos
-    result = []
-    prev = ""
-    for line in lines:
-        if line != prev:
-            result.append(line)
-            prev = line
-
-    return ' '.join(result)
+    return f"nugget_{safe_title(title)}_{video_id}.{extension}"
+
+
+@lru_cache(maxsize=1024)
+def safe_title(title: str, max_length: int = 50) -> str:
+    """
+    Título sin caracteres problemáticos para un nombre de archivo.
+
+    Cacheado: las exportaciones de un mismo nugget (HTML, Markdown, Anki)
+    suelen pedirse seguidas. Los títulos ASCII se filtran con bytes.translate;
+    el resto (acentos, otros alfabetos) con la regex.
+
+    Args:
+        title: Título del video
+        max_length: Longitud máxima antes de quitar espacios de los extremos
+
+    Returns:
+        Título saneado
+    """
+    if title.isascii():
+        title = title.encode('ascii').translate(None, TITLE_SANITIZER_DELETE).decode('ascii')
+        return title[:max_length].strip()
+    return TITLE_SANITIZER_REGEX.sub('', title)[:max_length].strip()
+
+
+def clean_vtt(vtt_content: Union[str, Path]) -> str:
+    """
+    Limpia el formato VTT y devuelve texto plano.
+
+    Las líneas fluyen por generadores hasta el join final, sin listas
+    intermedias del tamaño del archivo.
+
+    Args:
+        vtt_content: Contenido VTT, o la ruta del archivo
+
+    Returns:
+        Texto plano sin repeticiones
+    """
+    if isinstance(vtt_content, Path):
+        vtt_content = vtt_content.read_text(encoding='utf-8')
+
+    # Quitar el solape entre cues, y luego los duplicados consecutivos
+    lines = _drop_cue_overlap(_vtt_cues(vtt_content))
+    return ' '.join(line for line, _ in groupby(lines))
+
+
+def _vtt_cues(vtt_content: str) -> Iterator[list]:
+    """Líneas de texto de cada cue, en orden (los cues sin texto se omiten)."""
+    for cue in VTT_TIMING_REGEX.split(vtt_content):
+        cue = VTT_TAG_REGEX.sub('', VTT_NOISE_REGEX.sub('', cue))
+        lines = [match.group().strip() for match in VTT_LINE_REGEX.finditer(cue)]
+        if lines:
+            yield lines
+
+
+def _drop_cue_overlap(cues: Iterable[list]) -> Iterator[str]:
+    """
+    Líneas nuevas de cada cue.
+
+    Los subtítulos automáticos (con scroll) repiten al principio de cada cue
+    las últimas líneas del anterior. Solo se quitan esas líneas completas:
+    una frase que el hablante repite sigue en el texto.
+    """
+    previous = []
+    for lines in cues:
+        overlap = min(len(previous), len(lines))
+        while overlap and previous[-overlap:] != lines[:overlap]:
+            overlap -= 1
+        yield from lines[overlap:]
+        previous = lines
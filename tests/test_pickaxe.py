@@ -0,0 +1,48 @@
+"""
+Tests de pickaxe: limpieza de subtítulos VTT.
+"""
+
+import unittest
+
+from pickaxe import clean_vtt
+
+
+def vtt(cues: list) -> str:
+    """Archivo VTT con un cue por lista de líneas."""
+    body = ''.join(
+        f"00:00:{i:02d}.000 --> 00:00:{i + 1:02d}.000 align:start position:0%\n" + '\n'.join(lines) + '\n\n'
+        for i, lines in enumerate(cues)
+    )
+    return "WEBVTT\nKind: captions\nLanguage: es\n\n" + body
+
+
+SPEECH = [
+    'el bucle for i in range de diez',
+    'se repite diez veces',
+    'y el bucle for i in range de veinte',
+    'hoy vamos a ver',
+    'hoy vamos a ver y luego',
+]
+
+
+class CleanVttTest(unittest.TestCase):
+
+    def test_legitimate_repetition_survives(self):
+        self.assertEqual(clean_vtt(vtt([[line] for line in SPEECH])), ' '.join(SPEECH))
+
+    def test_rolling_captions_keep_repeated_speech(self):
+        # Subtítulos automáticos: cada cue repite la última línea del anterior
+        cues = [[SPEECH[0]]] + [[SPEECH[i - 1], SPEECH[i]] for i in range(1, len(SPEECH))]
+        self.assertEqual(clean_vtt(vtt(cues)), ' '.join(SPEECH))
+
+    def test_rolling_overlap_of_several_lines(self):
+        cues = [['uno', 'dos'], ['uno', 'dos', 'tres'], ['dos', 'tres', 'cuatro']]
+        self.assertEqual(clean_vtt(vtt(cues)), 'uno dos tres cuatro')
+
+    def test_tags_and_consecutive_duplicates(self):
+        cues = [['hola<00:00:00.480><c> a</c><c> todos</c>'], ['hola a todos'], [' '], ['bienvenidos']]
+        self.assertEqual(clean_vtt(vtt(cues)), 'hola a todos bienvenidos')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,13 +5,99 @@ Scanner para descubrir y obtener información de videos.
 """
 
 import json
+import os
+import re
 import subprocess
 import tempfile
+import time
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+from compass import META_CACHE_DIR, WHISPER_MODEL
 from pickaxe import clean_vtt
 
+# Vida de los metadatos cacheados (7 días)
+META_CACHE_TTL = 7 * 24 * 3600
+
+VIDEO_ID_REGEX = re.compile(r'(?:v=|youtu\.be/|shorts/)([\w-]{11})')
+
+
+def _meta_cache_path(url: str) -> Optional[Path]:
+    """Ruta del metadato cacheado de una URL, o None si no se reconoce su ID."""
+    match = VIDEO_ID_REGEX.search(url)
+    return META_CACHE_DIR / f"{match.group(1)}.json" if match else None
+
+
+def _read_meta_cache(url: str) -> Optional[dict]:
+    """Lee los metadatos cacheados de una URL si existen y no han caducado."""
+    path = _meta_cache_path(url)
+    if path is None:
+        return None
+    try:
+        if time.time() - path.stat().st_mtime > META_CACHE_TTL:
+            return None
+        return json.loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta_cache(url: str, info: dict):
+    """Guarda los metadatos de una URL (escritura atómica con os.replace)."""
+    path = _meta_cache_path(url)
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+        os.replace(tmp, path)
+    except OSError:
+        pass  # La caché es solo un atajo
+
+
+def scan_videos(urls: list) -> list:
+    """
+    Escanea varios videos con una sola ejecución de yt-dlp.
+
+    yt-dlp escribe un JSON por línea; arrancar el proceso una vez (en vez
+    de una por URL) ahorra el arranque de Python y reutiliza sus conexiones.
+    Los metadatos se cachean en META_CACHE_DIR por video_id durante
+    META_CACHE_TTL, así que volver a minar un video no toca la red.
+
+    Args:
+        urls: URLs de videos de YouTube
+
+    Returns:
+        Lista de metadatos en el mismo orden que urls (None para las URLs
+        que yt-dlp no pudo escanear)
+    """
+    infos = [_read_meta_cache(url) for url in urls]
+    missing = [url for url, info in zip(urls, infos) if info is None]
+    if not missing:
+        return infos
+
+    cmd = ["yt-dlp", "--dump-json", "--no-download", "--ignore-errors", *missing]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+
+    parsed = [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
+    by_url = {info.get('original_url'): info for info in parsed}
+    scanned = [by_url.get(url) for url in missing]
+
+    # Versiones sin original_url: si no falló ninguna, el orden coincide
+    if None in scanned and len(parsed) == len(missing):
+        scanned = parsed
+    if not any(scanned) and not any(infos):
+        raise Exception(f"Error escaneando video: {result.stderr}")
+
+    scanned = iter(scanned)
+    for i, info in enumerate(infos):
+        if info is None:
+            infos[i] = next(scanned)
+            if infos[i] is not None:
+                _write_meta_cache(urls[i], infos[i])
+    return infos
+
 
 def scan_video(url: str) -> dict:
     """
@@ -23,17 +109,21 @@ def scan_video(url: str) -> dict:
     Returns:
         dict con metadatos del video (id, title, channel, duration, etc.)
     """
-    cmd = ["yt-dlp", "--dump-json", "--no-download", url]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise Exception(f"Error escaneando video: {result.stderr}")
-    return json.loads(result.stdout)
+    return scan_videos([url])[0]
+
+
+# Idiomas de subtítulos, en orden de preferencia
+SUBTITLE_LANGS = ("es", "en")
 
 
 def extract_subtitles(url: str, video_id: str) -> Optional[str]:
     """
     Intenta extraer subtítulos existentes del video.
 
+    Una sola ejecución de yt-dlp pide todos los idiomas, manuales y
+    automáticos (yt-dlp prefiere los manuales si hay ambos), y luego se
+    elige el archivo del idioma preferido.
+
     Args:
         url: URL del video
         video_id: ID del video
@@ -42,35 +132,43 @@ def extract_subtitles(url: str, video_id: str) -> Optional[str]:
         Texto de subtítulos o None si no hay disponibles
     """
     with tempfile.TemporaryDirectory() as tmpdir:
-        # Intentar subtítulos en español, luego inglés, luego auto-generados
-        for lang in ["es", "en", "es-auto", "en-auto"]:
-            is_auto = "-auto" in lang
-            base_lang = lang.replace("-auto", "")
-
-            cmd = [
-                "yt-dlp",
-                "--skip-download",
-                "--write-sub" if not is_auto else "--write-auto-sub",
-                "--sub-lang", base_lang,
-                "--sub-format", "vtt",
-                "-o", f"{tmpdir}/{video_id}.%(ext)s",
-                url
-            ]
-
-            subprocess.run(cmd, capture_output=True)
-
-            # Buscar archivo de subtítulos generado
-            for f in Path(tmpdir).glob(f"{video_id}*.vtt"):
-                content = f.read_text()
-                return clean_vtt(content)
+        cmd = [
+            "yt-dlp",
+            "--skip-download",
+            "--write-sub", "--write-auto-sub",
+            "--sub-lang", ",".join(SUBTITLE_LANGS),
+            "--sub-format", "vtt",
+            "-o", f"{tmpdir}/{video_id}.%(ext)s",
+            url
+        ]
+        subprocess.run(cmd, capture_output=True)
+
+        # Archivos {video_id}.{lang}.vtt: el idioma es el penúltimo sufijo
+        def rank(path: Path) -> int:
+            lang = path.suffixes[-2][1:] if len(path.suffixes) >= 2 else ""
+            return SUBTITLE_LANGS.index(lang) if lang in SUBTITLE_LANGS else len(SUBTITLE_LANGS)
+
+        files = sorted(Path(tmpdir).glob(f"{video_id}*.vtt"), key=rank)
+        if files:
+            return clean_vtt(files[0])
 
     return None
 
 
+@lru_cache(maxsize=2)
+def _load_whisper(name: str):
+    """Carga un modelo de Whisper una sola vez por proceso."""
+    import whisper
+    return whisper.load_model(name)
+
+
 def transcribe_audio(url: str, video_id: str) -> str:
     """
     Descarga audio y transcribe con Whisper.
 
+    El modelo (VIDEOMINE_WHISPER_MODEL) se carga con el primer video y se
+    reutiliza en los siguientes.
+
     Args:
         url: URL del video
         video_id: ID del video
@@ -78,8 +176,6 @@ def transcribe_audio(url: str, video_id: str) -> str:
     Returns:
         Texto transcrito
     """
-    import whisper
-
     print("  ⏳ Descargando audio...")
     with tempfile.TemporaryDirectory() as tmpdir:
         audio_path = f"{tmpdir}/{video_id}.mp3"
@@ -92,6 +188,7 @@ def transcribe_audio(url: str, video_id: str) -> str:
         subprocess.run(cmd, capture_output=True)
 
         print("  ⏳ Transcribiendo con Whisper (puede tardar)...")
-        model = whisper.load_model("base")
-        result = model.transcribe(audio_path)
+        model = _load_whisper(WHISPER_MODEL)
+        # fp16 solo en GPU: en CPU Whisper avisa y cae a fp32 de todos modos
+        result = model.transcribe(audio_path, fp16=model.device.type == "cuda")
         return result["text"]
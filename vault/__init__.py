@@ -6,20 +6,211 @@ Base de datos y generación de HTML.
 """
 
 import json
+import sqlite3
+import threading
+from contextlib import closing
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
+from typing import Iterator
 
-import jinja2
 
-from compass import OUTPUT_DIR, TEMPLATE_DIR, DB_FILE, INDEX_FILE
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from compass import OUTPUT_DIR, TEMPLATE_DIR, DB_FILE, JSON_FILE, INDEX_FILE, META_CACHE_DIR
 from pickaxe import format_duration, get_safe_filename
 
 
+# Un nugget por fila (JSON completo en `json`); el rowid conserva el orden de
+# inserción, y INSERT OR REPLACE manda al final un nugget re-minado
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nuggets (
+    id TEXT PRIMARY KEY,
+    json BLOB NOT NULL,
+    title TEXT,
+    date TEXT
+)
+"""
+
+# Entorno Jinja2 compartido: cada plantilla se compila una vez por proceso
+# (sin auto_reload, no se vuelve a comprobar el archivo en cada render).
+# Se crea en el primer render: --delete o --export-json no cargan jinja2
+_jinja_env = None
+
+# Datos del índice: index.html los carga con <script src> (funciona en file://)
+INDEX_DATA_NAME = "nuggets.js"
+INDEX_CARD_FIELDS = (
+    "id", "title", "channel", "duration", "date", "url", "thumbnail", "file", "idea_principal",
+)
+_index_shell_written = False
+
+# Última lectura de la base de datos, reutilizada mientras (mtime, tamaño) no cambien
+_nuggets_cache = {"key": None, "data": None}
+_nuggets_lock = threading.Lock()
+
+
+def _loads(data):
+    """Parsea JSON desde str o bytes (orjson si está disponible)."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def _dumps(obj, indent: bool = False) -> bytes:
+    """Serializa a JSON UTF-8 en bytes (orjson si está disponible)."""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+
+def _connect(db_file: Path = DB_FILE) -> sqlite3.Connection:
+    """
+    Abre la base de datos del vault, creándola si no existe.
+
+    Una base de datos nueva importa el nuggets.json que haya a su lado,
+    en el mismo orden.
+    """
+    new = not db_file.exists()
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_file, timeout=30)
+    if new:
+        with con:
+            con.execute(SCHEMA)
+            legacy = db_file.with_suffix(".json")
+            if legacy.exists():
+                con.executemany(
+                    "INSERT OR REPLACE INTO nuggets VALUES (?, ?, ?, ?)",
+                    (_row(n) for n in _loads(legacy.read_bytes()) if n.get('id'))
+                )
+    return con
+
+
+def _row(nugget: dict) -> tuple:
+    """Fila de la tabla nuggets para un nugget."""
+    return (nugget['id'], _dumps(nugget), nugget.get('title'), nugget.get('date'))
+
+
+def read_nuggets(db_file: Path = DB_FILE) -> list:
+    """
+    Lee todos los nuggets de una base de datos del vault, sin cache.
+
+    Args:
+        db_file: Ruta a nuggets.sqlite
+
+    Returns:
+        Lista de nuggets en orden de inserción
+    """
+    with closing(_connect(db_file)) as con:
+        return [_loads(data) for (data,) in con.execute("SELECT json FROM nuggets ORDER BY rowid")]
+
+
 def load_nuggets() -> list:
-    """Carga la base de datos de nuggets."""
-    if DB_FILE.exists():
-        return json.loads(DB_FILE.read_text())
-    return []
+    """
+    Carga la base de datos de nuggets.
+
+    El resultado se cachea en memoria y solo se vuelve a leer si el
+    archivo cambia. La lista es compartida: no debe modificarse.
+    """
+    try:
+        st = DB_FILE.stat()
+    except FileNotFoundError:
+        if not JSON_FILE.exists():
+            return []
+        _connect().close()  # Primera vez: importa nuggets.json
+        st = DB_FILE.stat()
+
+    key = (st.st_mtime_ns, st.st_size)
+    with _nuggets_lock:
+        if _nuggets_cache["key"] != key:
+            _nuggets_cache["data"] = read_nuggets()
+            _nuggets_cache["key"] = key
+        return _nuggets_cache["data"]
+
+
+def _invalidate_cache():
+    """Fuerza a load_nuggets a releer tras una escritura."""
+    with _nuggets_lock:
+        _nuggets_cache["key"] = None
+
+
+def export_json(path: Path = JSON_FILE) -> int:
+    """
+    Exporta el vault a un nuggets.json (formato anterior a SQLite).
+
+    Args:
+        path: Archivo de destino
+
+    Returns:
+        Número de nuggets exportados
+    """
+    nuggets = load_nuggets()
+    path.write_bytes(_dumps(nuggets, indent=True))
+    return len(nuggets)
+
+
+class Vault:
+    """
+    La base de datos del vault vista como un diccionario id -> nugget.
+
+    Cada operación toca solo su fila (vault[id] = nugget es un UPSERT,
+    del vault[id] un DELETE), sin cargar ni reescribir el resto.
+    """
+
+    def __init__(self, db_file: Path = DB_FILE):
+        self.db_file = db_file
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with closing(_connect(self.db_file)) as con:
+            return con.execute(sql, params).fetchall()
+
+    def _write(self, sql: str, params: tuple) -> int:
+        with closing(_connect(self.db_file)) as con, con:
+            changed = con.execute(sql, params).rowcount
+        _invalidate_cache()
+        return changed
+
+    def __getitem__(self, video_id: str) -> dict:
+        rows = self._query("SELECT json FROM nuggets WHERE id = ?", (video_id,))
+        if not rows:
+            raise KeyError(video_id)
+        return _loads(rows[0][0])
+
+    def get(self, video_id: str, default=None):
+        try:
+            return self[video_id]
+        except KeyError:
+            return default
+
+    def __setitem__(self, video_id: str, nugget: dict):
+        self._write("INSERT OR REPLACE INTO nuggets VALUES (?, ?, ?, ?)", _row({**nugget, 'id': video_id}))
+
+    def __delitem__(self, video_id: str):
+        if not self._write("DELETE FROM nuggets WHERE id = ?", (video_id,)):
+            raise KeyError(video_id)
+
+    def __contains__(self, video_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM nuggets WHERE id = ?", (video_id,)))
+
+    def __len__(self) -> int:
+        return self._query("SELECT COUNT(*) FROM nuggets")[0][0]
+
+    def titles(self) -> Iterator[tuple]:
+        """Pares (id, título) en orden de inserción, leídos bajo demanda y sin parsear JSON."""
+        with closing(_connect(self.db_file)) as con:
+            yield from con.execute("SELECT id, title FROM nuggets ORDER BY rowid")
+
+
+def print_preview(vault: Vault, limit: int = 20):
+    """Lista los primeros nuggets del vault (solo se leen esos)."""
+    shown = 0
+    for video_id, title in islice(vault.titles(), limit):
+        print(f"   {video_id} - {(title or '')[:50]}")
+        shown += 1
+    remaining = len(vault) - shown
+    if remaining > 0:
+        print(f"   ... y {remaining} más")
 
 
 def save_nugget(video_info: dict, summary: dict, filename: str) -> list:
@@ -34,9 +225,27 @@ def save_nugget(video_info: dict, summary: dict, filename: str) -> list:
     Returns:
         Lista actualizada de nuggets
     """
-    nuggets = load_nuggets()
+    entry = nugget_entry(video_info, summary, filename)
 
-    entry = {
+    # UPSERT por id: sin duplicados y sin reescribir el resto del vault
+    Vault()[entry['id']] = entry
+
+    return load_nuggets()
+
+
+def nugget_entry(video_info: dict, summary: dict, filename: str) -> dict:
+    """
+    Construye la entrada del vault para un video resumido.
+
+    Args:
+        video_info: Metadatos del video
+        summary: Resumen estructurado del video
+        filename: Nombre del archivo HTML generado
+
+    Returns:
+        dict con el nugget tal como se guarda en la base de datos
+    """
+    return {
         "id": video_info['id'],
         "title": video_info.get('title', 'Sin título'),
         "channel": video_info.get('channel', 'Desconocido'),
@@ -56,12 +265,18 @@ def save_nugget(video_info: dict, summary: dict, filename: str) -> list:
         "transcript": summary.get('transcript', '')
     }
 
-    # Evitar duplicados
-    nuggets = [n for n in nuggets if n['id'] != entry['id']]
-    nuggets.append(entry)
 
-    DB_FILE.write_text(json.dumps(nuggets, indent=2, ensure_ascii=False))
-    return nuggets
+def _get_template(name: str):
+    """Devuelve una plantilla compilada, creando el entorno Jinja2 la primera vez."""
+    global _jinja_env
+    if _jinja_env is None:
+        import jinja2
+        _jinja_env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+            autoescape=True,
+            auto_reload=False
+        )
+    return _jinja_env.get_template(name)
 
 
 def forge_html(video_info: dict, summary: dict) -> str:
@@ -75,11 +290,7 @@ def forge_html(video_info: dict, summary: dict) -> str:
     Returns:
         HTML renderizado
     """
-    env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
-        autoescape=True
-    )
-    template = env.get_template("nugget.html")
+    template = _get_template("nugget.html")
 
     return template.render(
         video_id=video_info.get('id', ''),
@@ -97,16 +308,29 @@ def forge_index(nuggets: list):
     """
     Genera el índice HTML del vault.
 
+    index.html es una página fija que pinta las tarjetas en el navegador
+    desde nuggets.js: cada cambio en el vault solo reescribe ese archivo de
+    datos, sin renderizar plantillas. La página se escribe una vez por
+    proceso (y solo si cambió).
+
     Args:
         nuggets: Lista de nuggets
     """
-    env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
-        autoescape=True
-    )
-    template = env.get_template("index.html")
-    html = template.render(videos=nuggets)
-    INDEX_FILE.write_text(html)
+    global _index_shell_written
+    if not _index_shell_written:
+        html = _get_template("index.html").render().encode('utf-8')
+        try:
+            current = INDEX_FILE.read_bytes()
+        except FileNotFoundError:
+            current = None
+        if current != html:
+            INDEX_FILE.write_bytes(html)
+        _index_shell_written = True
+
+    # Solo los campos que pinta una tarjeta (sin transcripciones)
+    cards = [{field: n.get(field, '') for field in INDEX_CARD_FIELDS} for n in nuggets]
+    data_file = INDEX_FILE.with_name(INDEX_DATA_NAME)
+    data_file.write_bytes(b"window.VAULT_NUGGETS = " + _dumps(cards) + b";\n")
 
 
 def delete_nugget(video_id: str) -> bool:
@@ -119,15 +343,13 @@ def delete_nugget(video_id: str) -> bool:
     Returns:
         True si se eliminó, False si no se encontró
     """
-    nuggets = load_nuggets()
+    vault = Vault()
+    nugget = vault.get(video_id)
 
-    # Buscar nugget
-    nugget = next((n for n in nuggets if n['id'] == video_id), None)
     if not nugget:
         print(f"❌ Nugget no encontrado: {video_id}")
         print("\nNuggets disponibles:")
-        for n in nuggets:
-            print(f"   {n['id']} - {n['title'][:50]}")
+        print_preview(vault)
         return False
 
     # Borrar archivo HTML
@@ -136,9 +358,12 @@ def delete_nugget(video_id: str) -> bool:
         html_file.unlink()
         print(f"🗑️  Borrado: {html_file.name}")
 
+    # Olvidar los metadatos cacheados: si se vuelve a minar, se escanea de nuevo
+    (META_CACHE_DIR / f"{video_id}.json").unlink(missing_ok=True)
+
     # Actualizar DB
-    nuggets = [n for n in nuggets if n['id'] != video_id]
-    DB_FILE.write_text(json.dumps(nuggets, indent=2, ensure_ascii=False))
+    del vault[video_id]
+    nuggets = load_nuggets()
 
     # Regenerar índice
     forge_index(nuggets)
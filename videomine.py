@@ -7,7 +7,7 @@ Metodología minerOS:
 🔦 Tunnel    → yt-dlp (escanea el video)
 ⛏️  Pickaxe   → Subtítulos/Whisper (extrae transcripción)
 💎 Gemcutter → LLM (clasifica, resume, estructura)
-🏛️  Vault     → nuggets.json + *.html (almacenamiento)
+🏛️  Vault     → nuggets.sqlite + *.html (almacenamiento)
 🧭 Compass   → server.py (interfaz web)
 """
 
@@ -25,17 +25,21 @@ import json
 from pathlib import Path
 from datetime import datetime
 
-# Importar módulos minerOS
-from compass import OUTPUT_DIR, PENDING_DIR
-from pickaxe import get_safe_filename
-from tunnel import scan_video, extract_subtitles, transcribe_audio
-from gemcutter import cut_with_ollama, cut_with_claude, cut_with_claude_code, parse_nugget
-from vault import load_nuggets, save_nugget, forge_html, forge_index, delete_nugget
+# Importar módulos minerOS: solo compass aquí; tunnel, gemcutter y vault
+# se importan en las funciones que los usan, así --delete, --graph o
+# --finish arrancan sin cargar asyncio, http.client ni jinja2
+from compass import OUTPUT_DIR, PENDING_DIR, JSON_FILE
 
 # Flags de línea de comandos
 USE_CLAUDE = "--claude" in sys.argv
 USE_CLAUDE_CODE = "--claude-code" in sys.argv
 USE_MANUAL = "--manual" in sys.argv
+USE_CLAUDE_BATCH = "--claude-batch" in sys.argv
+
+# Pipeline de dig_many: URLs por yt-dlp y trabajadores por etapa
+SCAN_BATCH = 8
+TRANSCRIBE_WORKERS = 2
+LLM_WORKERS = 4
 
 
 def finish_nugget(video_id: str):
@@ -67,6 +71,9 @@ def finish_nugget(video_id: str):
         print("❌ No se recibió resumen")
         return None
 
+    from gemcutter import parse_nugget
+    from pickaxe import get_safe_filename
+    from vault import forge_html, save_nugget, forge_index
     summary = parse_nugget("\n".join(lines))
 
     # Generar HTML
@@ -89,27 +96,37 @@ def finish_nugget(video_id: str):
     return output_file
 
 
-def dig(url: str):
+def dig(url: str, video_info: dict = None):
     """
     Proceso principal de minería de un video.
 
+    Con un LLM es el pipeline de dig_many con un solo video (que escanea el
+    video por su cuenta); el modo manual sigue aquí porque pide el resumen
+    por stdin.
+
     Args:
         url: URL del video de YouTube
+        video_info: Solo en modo manual: metadatos ya escaneados (con
+            scan_videos), si los hay
     """
+    if not USE_MANUAL:
+        # Con un solo video, un fallo se propaga (y el CLI sale con error)
+        import asyncio
+        result = asyncio.run(dig_many([url], return_exceptions=True))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    from tunnel import scan_video, extract_subtitles, transcribe_audio
+    from gemcutter import parse_nugget
+
     print("⛏️  VideoMine - Extrayendo pepitas de conocimiento...")
-    if USE_MANUAL:
-        motor = "Manual (Claude Code)"
-    elif USE_CLAUDE_CODE:
-        motor = "Claude Code (suscripción)"
-    elif USE_CLAUDE:
-        motor = "Claude API (tokens)"
-    else:
-        motor = "Ollama (local)"
-    print(f"   Motor: {motor}")
+    print("   Motor: Manual (Claude Code)")
 
     # 1. TUNNEL: Escanear video
     print("\n🔦 [Tunnel] Escaneando video...")
-    video_info = scan_video(url)
+    if video_info is None:
+        video_info = scan_video(url)
     video_id = video_info['id']
     print(f"   Título: {video_info['title']}")
     print(f"   Canal: {video_info.get('channel', 'N/A')}")
@@ -124,72 +141,302 @@ def dig(url: str):
         print("   ⚠️  No hay subtítulos, usando Whisper...")
         transcript = transcribe_audio(url, video_id)
 
-    # 3. GEMCUTTER: Resumir con LLM
-    if USE_MANUAL:
-        # Modo manual: guardar transcripción y esperar JSON
-        PENDING_DIR.mkdir(parents=True, exist_ok=True)
-        transcript_file = PENDING_DIR / f"{video_id}.txt"
-        info_file = PENDING_DIR / f"{video_id}.json"
-
-        transcript_file.write_text(transcript)
-        info_file.write_text(json.dumps(video_info, indent=2, ensure_ascii=False))
-
-        print(f"\n📄 Transcripción guardada en: {transcript_file}")
-        print(f"\n{'='*60}")
-        print("MODO MANUAL - Pide a Claude que resuma esta transcripción")
-        print("="*60)
-        print(f"\nDile a Claude:")
-        print(f"  'Resume el video {video_id}' o")
-        print(f"  'Lee {transcript_file} y genera el resumen'")
-        print(f"\nLuego ejecuta:")
-        print(f"  python videomine.py --finish {video_id}")
-        print(f"\nO pega el JSON del resumen ahora (termina con línea vacía):")
-
-        # Leer JSON del stdin
-        lines = []
-        try:
-            while True:
-                line = input()
-                if line == "":
-                    break
-                lines.append(line)
-        except EOFError:
-            pass
+    # 3. GEMCUTTER: Modo manual, guardar transcripción y esperar JSON
+    PENDING_DIR.mkdir(parents=True, exist_ok=True)
+    transcript_file = PENDING_DIR / f"{video_id}.txt"
+    info_file = PENDING_DIR / f"{video_id}.json"
 
-        if lines:
-            summary = parse_nugget("\n".join(lines))
-        else:
-            print("\n⏸️  Transcripción guardada. Usa --finish cuando tengas el resumen.")
-            return None
-    else:
-        print("\n💎 [Gemcutter] Puliendo nugget...")
-        if USE_CLAUDE_CODE:
-            summary = cut_with_claude_code(transcript, video_info)
-        elif USE_CLAUDE:
-            summary = cut_with_claude(transcript, video_info)
-        else:
-            summary = cut_with_ollama(transcript, video_info)
+    transcript_file.write_text(transcript)
+    info_file.write_text(json.dumps(video_info, indent=2, ensure_ascii=False))
+
+    print(f"\n📄 Transcripción guardada en: {transcript_file}")
+    print(f"\n{'='*60}")
+    print("MODO MANUAL - Pide a Claude que resuma esta transcripción")
+    print("="*60)
+    print(f"\nDile a Claude:")
+    print(f"  'Resume el video {video_id}' o")
+    print(f"  'Lee {transcript_file} y genera el resumen'")
+    print(f"\nLuego ejecuta:")
+    print(f"  python videomine.py --finish {video_id}")
+    print(f"\nO pega el JSON del resumen ahora (termina con línea vacía):")
+
+    # Leer JSON del stdin
+    lines = []
+    try:
+        while True:
+            line = input()
+            if line == "":
+                break
+            lines.append(line)
+    except EOFError:
+        pass
+
+    if not lines:
+        print("\n⏸️  Transcripción guardada. Usa --finish cuando tengas el resumen.")
+        return None
+    summary = parse_nugget("\n".join(lines))
 
     # 4. VAULT: Almacenar nugget
     print("\n🏛️  [Vault] Almacenando nugget...")
+    output_file = store_nugget(video_info, summary)
+
+    print(f"\n✅ ¡Nugget extraído! Guardado en:")
+    print(f"   {output_file}")
+    print(f"\n   Abrir vault: open '{OUTPUT_DIR / 'index.html'}'")
+
+    return output_file
+
+
+def store_nugget(video_info: dict, summary: dict, update_index: bool = True) -> Path:
+    """
+    Genera el HTML del nugget, lo guarda y actualiza el índice del vault.
+
+    Con update_index=False solo se guarda el nugget: al minar varios videos
+    el índice se regenera una vez al final (refresh_index).
+    """
+    from pickaxe import get_safe_filename
+    from vault import Vault, nugget_entry, forge_html, save_nugget, forge_index
     html = forge_html(video_info, summary)
 
     OUTPUT_DIR.mkdir(exist_ok=True)
-    output_file = OUTPUT_DIR / get_safe_filename(video_info['title'], video_id)
+    output_file = OUTPUT_DIR / get_safe_filename(video_info['title'], video_info['id'])
     output_file.write_text(html)
 
+    if not update_index:
+        entry = nugget_entry(video_info, summary, output_file.name)
+        Vault()[entry['id']] = entry
+        return output_file
+
     # 5. Actualizar índice
     print("📚 Actualizando índice...")
     nuggets = save_nugget(video_info, summary, output_file.name)
     forge_index(nuggets)
 
-    print(f"\n✅ ¡Nugget extraído! Guardado en:")
-    print(f"   {output_file}")
-    print(f"\n   Abrir vault: open '{OUTPUT_DIR / 'index.html'}'")
-
     return output_file
 
 
+def refresh_index():
+    """Regenera el índice del vault tras guardar varios nuggets."""
+    from vault import load_nuggets, forge_index
+    print("📚 Actualizando índice...")
+    forge_index(load_nuggets())
+
+
+async def dig_many(urls: list, return_exceptions: bool = False) -> list:
+    """
+    Mina varios videos en un pipeline de etapas conectadas por colas.
+
+    Tunnel → Pickaxe → Gemcutter → Vault: mientras un video está en el LLM,
+    los siguientes ya se escanean y transcriben, así que el tiempo total
+    depende de la etapa más lenta y no de la suma de todas. Cada etapa tiene
+    su propio número de trabajadores; Whisper corre de uno en uno y un único
+    trabajador escribe en el vault, así que las escrituras nunca se solapan.
+    Con Claude Code, cada llamada resume hasta NUGGETS_PER_PROMPT videos de
+    los que ya esperan en la cola.
+
+    Args:
+        urls: URLs de videos de YouTube
+        return_exceptions: Devolver la excepción de cada video que falló en
+            lugar de None
+
+    Returns:
+        Lista de archivos generados (None, o la excepción, para los videos
+        que fallaron)
+    """
+    import asyncio
+    from tunnel import scan_videos, extract_subtitles, transcribe_audio
+    from gemcutter import cut_many_with_claude_code, acut_with_ollama, acut_with_claude, NUGGETS_PER_PROMPT
+
+    if USE_CLAUDE_CODE:
+        motor, acut = "Claude Code (suscripción)", None
+    elif USE_CLAUDE:
+        motor, acut = "Claude API (tokens)", acut_with_claude
+    else:
+        motor, acut = "Ollama (local)", acut_with_ollama
+
+    print(f"⛏️  VideoMine - Minando {len(urls)} videos...")
+    print(f"   Motor: {motor}")
+
+    # Resultado por posición: Path si terminó, Exception si falló
+    results = [None] * len(urls)
+    scanned = asyncio.Queue()      # (i, url, video_info)
+    transcribed = asyncio.Queue()  # (i, video_info, transcript)
+    summarized = asyncio.Queue()   # (i, video_info, summary)
+    whisper_lock = asyncio.Lock()
+
+    async def scan():
+        # Un yt-dlp por grupo de SCAN_BATCH URLs: el primer grupo ya avanza
+        # por el pipeline mientras se escanea el siguiente
+        for start in range(0, len(urls), SCAN_BATCH):
+            group = urls[start:start + SCAN_BATCH]
+            try:
+                infos = await asyncio.to_thread(scan_videos, group)
+            except Exception as e:
+                # Falló todo el grupo: cada URL conserva el error de yt-dlp
+                infos = [e] * len(group)
+
+            for i, (url, video_info) in enumerate(zip(group, infos), start):
+                if isinstance(video_info, Exception):
+                    results[i] = video_info
+                    continue
+                if video_info is None:
+                    results[i] = Exception("no se pudo escanear")
+                    continue
+                print(f"🔦 [Tunnel] {video_info['title']} ({video_info.get('channel', 'N/A')})")
+                await scanned.put((i, url, video_info))
+
+    async def transcribe():
+        while True:
+            item = await scanned.get()
+            if item is None:
+                break
+            i, url, video_info = item
+            video_id = video_info['id']
+            try:
+                transcript = await asyncio.to_thread(extract_subtitles, url, video_id)
+                if transcript:
+                    print(f"⛏️  [Pickaxe] {video_id}: subtítulos ({len(transcript)} caracteres)")
+                else:
+                    print(f"   ⚠️  {video_id}: sin subtítulos, usando Whisper...")
+                    async with whisper_lock:
+                        transcript = await asyncio.to_thread(transcribe_audio, url, video_id)
+            except Exception as e:
+                results[i] = e
+                continue
+            await transcribed.put((i, video_info, transcript))
+
+    async def summarize():
+        finished = False
+        while not finished:
+            item = await transcribed.get()
+            if item is None:
+                break
+            group = [item]
+
+            # Claude Code: juntar en un prompt los videos que ya esperan
+            while acut is None and len(group) < NUGGETS_PER_PROMPT:
+                try:
+                    item = transcribed.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                group.append(item)
+
+            for _, video_info, _ in group:
+                print(f"💎 [Gemcutter] Puliendo: {video_info['title']}")
+            try:
+                if acut is None:
+                    summaries = await asyncio.to_thread(
+                        cut_many_with_claude_code, [(transcript, info) for _, info, transcript in group]
+                    )
+                else:
+                    _, video_info, transcript = group[0]
+                    summaries = {video_info['id']: await acut(transcript, video_info)}
+            except Exception as e:
+                for i, _, _ in group:
+                    results[i] = e
+                continue
+
+            for i, video_info, _ in group:
+                await summarized.put((i, video_info, summaries[video_info['id']]))
+
+    async def store():
+        while True:
+            item = await summarized.get()
+            if item is None:
+                break
+            i, video_info, summary = item
+            print(f"🏛️  [Vault] Almacenando: {video_info['title']}")
+            try:
+                results[i] = await asyncio.to_thread(store_nugget, video_info, summary, False)
+            except Exception as e:
+                results[i] = e
+
+    async def stage(workers: list, next_queue: asyncio.Queue, next_workers: int):
+        # Cuando una etapa termina, un None por trabajador cierra la siguiente
+        await asyncio.gather(*workers)
+        for _ in range(next_workers):
+            await next_queue.put(None)
+
+    await asyncio.gather(
+        stage([scan()], scanned, TRANSCRIBE_WORKERS),
+        stage([transcribe() for _ in range(TRANSCRIBE_WORKERS)], transcribed, LLM_WORKERS),
+        stage([summarize() for _ in range(LLM_WORKERS)], summarized, 1),
+        store(),
+    )
+
+    # Un solo índice para todo el lote
+    if any(isinstance(result, Path) for result in results):
+        await asyncio.to_thread(refresh_index)
+
+    output_files = []
+    for url, result in zip(urls, results):
+        if isinstance(result, Exception):
+            print(f"❌ Error con {url}: {result}")
+            output_files.append(result if return_exceptions else None)
+        else:
+            output_files.append(result)
+
+    done = sum(1 for f in output_files if isinstance(f, Path))
+    print(f"\n✅ {done}/{len(urls)} nuggets extraídos")
+    print(f"   Abrir vault: open '{OUTPUT_DIR / 'index.html'}'")
+    return output_files
+
+
+def dig_batch(urls: list) -> list:
+    """
+    Mina varios videos con la Message Batches API de Claude (mitad de coste,
+    resultados en minutos u horas).
+
+    Args:
+        urls: URLs de videos de YouTube
+
+    Returns:
+        Lista de archivos generados
+    """
+    from tunnel import scan_videos, extract_subtitles, transcribe_audio
+    from gemcutter import cut_batch_with_claude
+
+    print(f"⛏️  VideoMine - Minando {len(urls)} videos...")
+    print("   Motor: Claude Batches API (tokens a mitad de precio)")
+
+    print("\n🔦 [Tunnel] Escaneando videos...")
+    items = []
+    for url, video_info in zip(urls, scan_videos(urls)):
+        if video_info is None:
+            print(f"❌ No se pudo escanear: {url}")
+            continue
+
+        print(f"⛏️  [Pickaxe] {video_info['title']}")
+        transcript = extract_subtitles(url, video_info['id'])
+        if not transcript:
+            print("   ⚠️  No hay subtítulos, usando Whisper...")
+            transcript = transcribe_audio(url, video_info['id'])
+        items.append((transcript, video_info))
+
+    if not items:
+        return []
+
+    print("\n💎 [Gemcutter] Enviando batch a Claude...")
+    summaries = cut_batch_with_claude(items)
+
+    output_files = []
+    for _, video_info in items:
+        summary = summaries.get(video_info['id'])
+        if summary is None:
+            print(f"❌ Sin resumen: {video_info['title']}")
+            continue
+        print(f"🏛️  [Vault] Almacenando: {video_info['title']}")
+        output_files.append(store_nugget(video_info, summary, update_index=False))
+
+    if output_files:
+        refresh_index()
+    print(f"\n✅ {len(output_files)}/{len(urls)} nuggets extraídos")
+    return output_files
+
+
 def main():
     # Comando --server
     if "--server" in sys.argv:
@@ -201,12 +448,24 @@ def main():
     if "--delete" in sys.argv:
         idx = sys.argv.index("--delete")
         if idx + 1 < len(sys.argv):
+            from vault import delete_nugget
             delete_nugget(sys.argv[idx + 1])
             return
         else:
             print("Uso: --delete VIDEO_ID")
             return
 
+    # Comando --export-json (vault → nuggets.json)
+    if "--export-json" in sys.argv:
+        idx = sys.argv.index("--export-json")
+        path = JSON_FILE
+        if idx + 1 < len(sys.argv) and not sys.argv[idx + 1].startswith('--'):
+            path = Path(sys.argv[idx + 1])
+        from vault import export_json
+        count = export_json(path)
+        print(f"✅ {count} nuggets exportados a {path}")
+        return
+
     # Comando --finish
     if "--finish" in sys.argv:
         idx = sys.argv.index("--finish")
@@ -238,9 +497,17 @@ def main():
     # Comando --rebuild-graph (reconstruir grafo completo)
     if "--rebuild-graph" in sys.argv:
         import cartographer
+        workers = None
+        if "--workers" in sys.argv:
+            idx = sys.argv.index("--workers")
+            if idx + 1 < len(sys.argv) and sys.argv[idx + 1].isdigit():
+                workers = int(sys.argv[idx + 1])
+            else:
+                print("Uso: --rebuild-graph --workers N")
+                return
         print("🗺️  Reconstruyendo grafo de conocimiento...")
         try:
-            stats = cartographer.rebuild()
+            stats = cartographer.rebuild(max_workers=workers)
             print(f"   ✅ {stats['concepts']} conceptos")
             print(f"   ✅ {stats['relations']} relaciones")
             print(f"   ✅ {stats['videos']} videos procesados")
@@ -270,30 +537,61 @@ Metodología minerOS:
   🏛️  Vault     → Almacena nugget (HTML + JSON)
   🧭 Compass   → Interfaz web (Flask)
 
-Uso: python videomine.py URL [opciones]
+Uso: python videomine.py URL [URL ...] [opciones]
 
 Opciones:
   --claude-code     Usar Claude Code CLI (tu suscripción Pro/Max)
   --claude          Usar Claude API (requiere ANTHROPIC_API_KEY, paga tokens)
+  --claude-batch    Claude Batches API para varios videos (mitad de precio, más lento)
   --manual          Guarda transcripción para resumir manualmente
   --finish ID       Completar video pendiente con resumen JSON
   --delete ID       Eliminar nugget del vault
+  --export-json [F] Exportar el vault a nuggets.json (o al archivo F)
   --server          Iniciar interfaz web (Compass)
   --map ID          Extraer conceptos de un video al grafo
   --rebuild-graph   Reconstruir grafo completo desde todos los nuggets
+  --workers N       Extracciones simultáneas en --rebuild-graph (por defecto 4)
   --graph           Abrir vista del grafo en navegador
 
 Ejemplos:
   python videomine.py 'URL'                   # Usa Ollama (local)
+  python videomine.py 'URL1' 'URL2'           # Varios videos en paralelo
   python videomine.py 'URL' --claude-code     # Usa tu suscripción
   python videomine.py 'URL' --claude          # Usa API (tokens)
   python videomine.py --server                # Abre el Vault web
   python videomine.py --delete abc123
+  python videomine.py --export-json           # Copia JSON del vault
+
+Varios videos con Ollama solo se resumen en paralelo si el servidor de
+Ollama se inicia con OLLAMA_NUM_PARALLEL > 1 (p. ej. OLLAMA_NUM_PARALLEL=4 ollama serve).
 """)
         sys.exit(1)
 
-    url = args[0]
-    dig(url)
+    if USE_CLAUDE_BATCH:
+        dig_batch(args)
+        return
+
+    if len(args) == 1:
+        dig(args[0])
+        return
+
+    # Varios videos en paralelo (el modo manual pide el resumen por stdin, uno a uno)
+    if not USE_MANUAL:
+        import asyncio
+        asyncio.run(dig_many(args))
+        return
+
+    from tunnel import scan_videos
+
+    print(f"🔦 [Tunnel] Escaneando {len(args)} videos...")
+    for url, video_info in zip(args, scan_videos(args)):
+        if video_info is None:
+            print(f"❌ No se pudo escanear: {url}")
+            continue
+        try:
+            dig(url, video_info)
+        except Exception as e:
+            print(f"❌ Error con {url}: {e}")
 
 
 if __name__ == "__main__":